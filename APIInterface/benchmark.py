@@ -0,0 +1,425 @@
+"""APIInterface端到端压测脚本
+
+在本地启动一个模拟api_config.toml中各接口的aiohttp服务（图片、视频、JSON、HTML包裹的JSON、
+慢响应和错误响应），把插件的接口地址全部指向它，再用模拟的WechatAPIClient按设定的速率
+调用handle_text，统计每秒处理的消息数、回复延迟分位数和进程启动以来的峰值内存。全程不访问外网。
+
+在XYBotV2根目录下运行：
+
+    python plugins/APIInterface/benchmark.py --rate 20,50,100 --duration 20
+
+导入不到XYBotV2的WechatAPI和utils时（例如单独检出本插件），使用最小的替身模块，
+可以在任意目录下运行。
+
+每个速率档位使用一个新的插件实例，依次运行并分别输出结果。
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import time
+import types
+import urllib.parse
+
+sys.path.insert(0, os.getcwd())
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from aiohttp import web
+from loguru import logger
+
+
+def _install_framework_stubs():
+    """XYBotV2框架不可导入时，向sys.modules注入main.py用到的最小替身模块"""
+    try:
+        import WechatAPI  # noqa: F401
+        import utils.decorators  # noqa: F401
+        import utils.plugin_base  # noqa: F401
+        return
+    except ImportError:
+        pass
+
+    def passthrough(*args, **kwargs):
+        # 同时支持@on_text_message和@on_text_message(priority=50)两种写法
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda func: func
+
+    class WechatAPIClient:
+        pass
+
+    class PluginBase:
+        def __init__(self):
+            self.enabled = False
+
+        async def on_enable(self, bot=None):
+            pass
+
+        async def on_disable(self):
+            pass
+
+        async def async_init(self):
+            pass
+
+    wechat_api = types.ModuleType("WechatAPI")
+    wechat_api.WechatAPIClient = WechatAPIClient
+    decorators = types.ModuleType("utils.decorators")
+    for name in ("on_text_message", "on_at_message", "on_image_message", "on_voice_message",
+                 "on_file_message", "on_video_message", "on_quote_message", "on_pat_message",
+                 "on_emoji_message", "schedule"):
+        setattr(decorators, name, passthrough)
+    plugin_base = types.ModuleType("utils.plugin_base")
+    plugin_base.PluginBase = PluginBase
+    utils = types.ModuleType("utils")
+    utils.decorators = decorators
+    utils.plugin_base = plugin_base
+    sys.modules.update({
+        "WechatAPI": wechat_api,
+        "utils": utils,
+        "utils.decorators": decorators,
+        "utils.plugin_base": plugin_base,
+    })
+
+
+_install_framework_stubs()
+
+from main import APIInterface  # noqa: E402
+
+BUSY_REPLY = "⚠️ 当前请求较多，请稍后再试"
+
+# 不直接作为命令发送的接口：由前缀命令或星座名触发
+INDIRECT_APIS = ("星座", "短剧", "小说")
+
+
+class StubUpstream:
+    """模拟上游接口的本地HTTP服务"""
+
+    def __init__(self, args):
+        self.args = args
+        self.kinds = {}
+        self.requests = 0
+        self.image = b"\xff\xd8\xff\xe0" + os.urandom(args.image_bytes)
+        self.video = b"\x00\x00\x00\x18ftypmp42" + os.urandom(args.video_bytes)
+        self.runner = None
+        self.base_url = ""
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/api/{name}", self.handle_api)
+        app.router.add_get("/media/video", self.handle_video)
+        app.router.add_get("/media/image", self.handle_image)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = self.runner.addresses[0][:2]
+        self.base_url = f"http://{host}:{port}"
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    def route(self, cmd: str, api_config: dict) -> str:
+        """为API分配模拟行为，返回本地地址"""
+        return_type = api_config.get("return_type", "text").lower()
+        if cmd == "星座":
+            kind = "constellation"
+        elif cmd == "短剧":
+            kind = "drama"
+        elif cmd == "小说":
+            kind = "novel"
+        elif return_type == "json":
+            kind = "video_json"
+        else:
+            kind = return_type
+        self.kinds[cmd] = kind
+        return f"{self.base_url}/api/{urllib.parse.quote(cmd, safe='')}"
+
+    async def handle_api(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        if random.random() < self.args.error_ratio:
+            return web.Response(status=503, text="Service Unavailable")
+        if random.random() < self.args.slow_ratio:
+            await asyncio.sleep(self.args.slow_delay)
+        else:
+            await asyncio.sleep(self.args.upstream_latency)
+
+        kind = self.kinds.get(request.match_info["name"], "text")
+        if kind == "img":
+            return web.Response(body=self.image, content_type="image/jpeg")
+        if kind == "video":
+            return web.Response(body=self.video, content_type="video/mp4")
+        if kind == "video_json":
+            return web.json_response({"code": 200, "data": {"videourl": f"{self.base_url}/media/video"}})
+        if kind == "constellation":
+            data = {"code": 200, "data": {
+                "title": f"{request.query.get('xz', '')}座今日运势", "time": time.strftime("%Y-%m-%d"),
+                "shortcomment": "平稳", "luckynumber": "7", "luckycolor": "蓝色", "luckyconstellation": "天秤",
+                "health": "80%", "discuss": "70%", "alltext": "今日运势平稳。" * 20, "lovetext": "感情顺利。" * 10,
+                "worktext": "工作有进展。" * 10, "moneytext": "财运一般。" * 10, "healthtxt": "注意休息。" * 10
+            }}
+            # 模拟把JSON包在HTML页面里返回的接口
+            html = f"<html><head><title>xz</title></head><body><pre>{json.dumps(data, ensure_ascii=False)}</pre></body></html>"
+            return web.Response(text=html, content_type="text/html")
+        if kind == "drama":
+            keyword = request.query.get("name", "")
+            dramas = [
+                {"title": f"{keyword}短剧{i}", "author": "主演甲、主演乙", "type": "都市", "intro": "简介" * 30, "link": f"https://example.invalid/drama/{i}"}
+                for i in range(12)
+            ]
+            return web.json_response({"code": 200, "data": dramas})
+        if kind == "novel":
+            keyword = request.query.get("name", "")
+            if "n" in request.query:
+                # 序号详情，插件在搜索回复发出后会后台预取前几部的详情和封面
+                index = request.query["n"]
+                return web.json_response({
+                    "title": f"{keyword}小说{index}", "author": "作者", "type": "玄幻",
+                    "img": f"{self.base_url}/media/image", "download": f"https://example.invalid/novel/{index}",
+                    "summary": "内容简介" * 50
+                })
+            novels = [
+                {"title": f"{keyword}小说{i}", "author": "作者", "type": "玄幻", "img": "", "summary": "内容简介" * 50}
+                for i in range(20)
+            ]
+            return web.json_response(novels)
+        return web.Response(text="stub upstream text reply " * 10)
+
+    async def handle_video(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        await asyncio.sleep(self.args.upstream_latency)
+        return web.Response(body=self.video, content_type="video/mp4")
+
+    async def handle_image(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        await asyncio.sleep(self.args.upstream_latency)
+        return web.Response(body=self.image, content_type="image/jpeg")
+
+
+class FakeBot:
+    """模拟的WechatAPIClient，按固定延迟加带宽计算发送耗时，并在每次发送时回调"""
+
+    def __init__(self, args, on_reply):
+        self.args = args
+        self.on_reply = on_reply
+        self.sent = {"text": 0, "img": 0, "video": 0}
+        self.sent_bytes = 0
+        self._msg_id = 0
+
+    async def _upload(self, wxid: str, kind: str, payload) -> int:
+        if isinstance(payload, (str, os.PathLike)) and os.path.isfile(payload):
+            size = os.path.getsize(payload)
+        else:
+            size = len(payload)
+        bandwidth = self.args.send_bandwidth * 1024 * 1024
+        await asyncio.sleep(self.args.send_latency + (size / bandwidth if bandwidth > 0 else 0))
+        self.sent[kind] += 1
+        self.sent_bytes += size
+        self._msg_id += 1
+        self.on_reply(wxid, kind, payload if kind == "text" else None)
+        return self._msg_id
+
+    async def send_text_message(self, wxid: str, content: str, at=""):
+        msg_id = await self._upload(wxid, "text", content)
+        return (msg_id, int(time.time()), msg_id)
+
+    async def send_image_message(self, wxid: str, image):
+        msg_id = await self._upload(wxid, "img", image)
+        return (msg_id, int(time.time()), msg_id)
+
+    async def send_video_message(self, wxid: str, video, image=None):
+        msg_id = await self._upload(wxid, "video", video)
+        return (msg_id, msg_id)
+
+
+def build_plugin(args, upstream: StubUpstream) -> APIInterface:
+    """创建插件实例，并把所有接口地址指向本地模拟服务"""
+    plugin = APIInterface()
+    plugin.enable = True
+    plugin.ignore_mode = ""
+    plugin.reload_config = {**plugin.reload_config, "enable": False}
+    plugin.metrics_config = {}
+    # 星座走实时请求路径，不预热
+    plugin.horoscope_config = {**plugin.horoscope_config, "enable": False}
+    # 默认使用config.toml中的限流和发送间隔，只有显式指定时才覆盖
+    if args.no_rate_limit:
+        plugin.ratelimit_config = {**plugin.ratelimit_config, "enable": False}
+    if args.send_interval is not None:
+        plugin.outbox_config = {**plugin.outbox_config, "chat_interval": args.send_interval}
+    if args.send_rate is not None:
+        plugin.outbox_config = {**plugin.outbox_config, "rate": args.send_rate}
+    if args.workers:
+        plugin.admission_config = {**plugin.admission_config, "workers": args.workers}
+    if args.max_queue:
+        plugin.admission_config = {**plugin.admission_config, "max_queue": args.max_queue}
+    if args.no_cache:
+        plugin.cache_config = {**plugin.cache_config, "enabled": False}
+
+    api_configs = {}
+    for cmd, api_config in plugin.api_configs.items():
+        api_config = dict(api_config, url=upstream.route(cmd, api_config))
+        if api_config.get("endpoints"):
+            # 端点组的每个端点都指向同一个模拟接口，仍然经过负载均衡逻辑
+            api_config["endpoints"] = [{"url": api_config["url"]} for _ in api_config["endpoints"]]
+        api_config.pop("params", None)
+        if args.no_prefetch:
+            api_config.pop("prefetch", None)
+        api_configs[cmd] = api_config
+    plugin.api_configs = api_configs
+    plugin._build_dispatcher()
+    return plugin
+
+
+def default_commands(plugin: APIInterface) -> list:
+    """默认的消息组合：所有可直接调用的API，加上星座、短剧、小说和运势命令"""
+    commands = [cmd for cmd in plugin.api_configs if cmd not in INDIRECT_APIS]
+    commands += ["白羊", "天蝎", "短剧总裁", "小说玄幻", "运势"]
+    return commands
+
+
+def percentile(values: list, q: float) -> float:
+    """最近秩法计算分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))]
+
+
+async def run_once(args, rate: float) -> dict:
+    """以指定速率运行一轮压测"""
+    upstream = StubUpstream(args)
+    await upstream.start()
+
+    pending = {}
+    latencies = []
+    counters = {"busy": 0, "throttled": 0}
+    last_reply = [0.0]
+
+    def on_reply(wxid: str, kind: str, text):
+        started = pending.pop(wxid, None)
+        if started is None:
+            return
+        last_reply[0] = time.monotonic()
+        if text == BUSY_REPLY:
+            counters["busy"] += 1
+        elif text and text.startswith("⏳"):
+            counters["throttled"] += 1
+        else:
+            latencies.append(last_reply[0] - started)
+
+    plugin = build_plugin(args, upstream)
+    bot = FakeBot(args, on_reply)
+    commands = args.commands.split(",") if args.commands else default_commands(plugin)
+    await plugin.async_init()
+
+    total = int(rate * args.duration)
+    tasks = set()
+    started_at = sent_at = time.monotonic()
+    try:
+        for i in range(total):
+            delay = started_at + i / rate - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            wxid = f"bench_{i}@chatroom"
+            message = {
+                "Content": random.choice(commands),
+                "FromWxid": wxid,
+                "SenderWxid": f"wxid_bench_user_{i % args.users}",
+                "IsGroup": True
+            }
+            pending[wxid] = time.monotonic()
+            task = asyncio.create_task(plugin.handle_text(bot, message))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        sent_at = time.monotonic()
+
+        # 等待所有消息得到回复，超过drain秒仍未回复的计为未完成
+        deadline = time.monotonic() + args.drain
+        while pending and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+    finally:
+        await plugin.on_disable()
+        await upstream.stop()
+
+    elapsed = max(last_reply[0], sent_at) - started_at
+    api_latency = {}
+    for (name, labels), histogram in plugin._histograms.items():
+        if name == "apiinterface_api_duration_seconds":
+            api_latency[dict(labels)["api"]] = (histogram.count, histogram.quantile(0.5), histogram.quantile(0.95))
+
+    return {
+        "rate": rate,
+        "sent": total,
+        "served": len(latencies),
+        "busy": counters["busy"],
+        "throttled": counters["throttled"],
+        "unanswered": len(pending),
+        "elapsed": elapsed,
+        "throughput": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "p50": percentile(latencies, 0.5),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "max": max(latencies, default=0.0),
+        "upstream_requests": upstream.requests,
+        "sent_messages": dict(bot.sent),
+        "sent_mb": bot.sent_bytes / 1024 / 1024,
+        # ru_maxrss是进程启动以来的峰值，多个档位依次运行时不是本档位单独的数值
+        "process_peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "api_latency": api_latency
+    }
+
+
+def print_report(result: dict):
+    print(f"\n=== 目标速率 {result['rate']:g} 条/秒 ===")
+    print(f"发送 {result['sent']} 条，完成 {result['served']}，繁忙拒绝 {result['busy']}，"
+          f"限流 {result['throttled']}，未回复 {result['unanswered']}，用时 {result['elapsed']:.1f}s")
+    print(f"吞吐: {result['throughput']:.1f} 条/秒")
+    print(f"回复延迟: p50 {result['p50'] * 1000:.0f}ms  p95 {result['p95'] * 1000:.0f}ms  "
+          f"p99 {result['p99'] * 1000:.0f}ms  max {result['max'] * 1000:.0f}ms")
+    print(f"上游请求 {result['upstream_requests']} 次，发出消息 {result['sent_messages']}，共 {result['sent_mb']:.1f}MB")
+    print(f"进程启动以来的峰值内存(ru_maxrss): {result['process_peak_rss_mb']:.1f}MB")
+    for cmd, (count, p50, p95) in sorted(result["api_latency"].items()):
+        print(f"  {cmd}: {count}次  p50 {p50 * 1000:.0f}ms  p95 {p95 * 1000:.0f}ms")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="APIInterface端到端压测")
+    parser.add_argument("--rate", default="20", help="每秒发送的消息数，可用逗号分隔多个档位，例如 20,50,100")
+    parser.add_argument("--duration", type=float, default=10, help="每个档位持续发送的时间(秒)")
+    parser.add_argument("--drain", type=float, default=30, help="发送结束后等待回复的最长时间(秒)")
+    parser.add_argument("--commands", default="", help="逗号分隔的消息内容，默认使用所有可直接调用的命令")
+    parser.add_argument("--users", type=int, default=50, help="模拟的发送者数量")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子")
+    parser.add_argument("--image-bytes", type=int, default=150 * 1024, help="模拟图片大小(字节)")
+    parser.add_argument("--video-bytes", type=int, default=1024 * 1024, help="模拟视频大小(字节)")
+    parser.add_argument("--upstream-latency", type=float, default=0.05, help="上游正常响应延迟(秒)")
+    parser.add_argument("--slow-ratio", type=float, default=0.05, help="慢响应比例")
+    parser.add_argument("--slow-delay", type=float, default=2.0, help="慢响应延迟(秒)")
+    parser.add_argument("--error-ratio", type=float, default=0.02, help="返回503的比例")
+    parser.add_argument("--send-latency", type=float, default=0.02, help="模拟客户端每次发送的固定耗时(秒)")
+    parser.add_argument("--send-bandwidth", type=float, default=20, help="模拟客户端上传带宽(MB/s)，0表示不限")
+    parser.add_argument("--send-interval", type=float, default=None, help="覆盖发给同一接收者的最小间隔(秒)，默认使用config.toml的设置")
+    parser.add_argument("--send-rate", type=float, default=None, help="覆盖全局发送速率上限(条/秒)，0表示不限，默认使用config.toml的设置")
+    parser.add_argument("--workers", type=int, default=0, help="覆盖工作协程数")
+    parser.add_argument("--max-queue", type=int, default=0, help="覆盖工作队列长度")
+    parser.add_argument("--no-rate-limit", action="store_true", help="关闭限流，配合--send-rate 0测量插件本身的处理能力")
+    parser.add_argument("--no-cache", action="store_true", help="关闭响应缓存")
+    parser.add_argument("--no-prefetch", action="store_true", help="关闭随机媒体预取")
+    parser.add_argument("--log-level", default="WARNING", help="插件日志级别")
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    random.seed(args.seed)
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    for rate in (float(value) for value in args.rate.split(",")):
+        print_report(await run_once(args, rate))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -3,6 +3,7 @@ import aiohttp
 import json
 import os
 import re
+import stat
 import urllib.parse
 
 # 尝试导入TOML相关库
@@ -25,19 +26,723 @@ except ImportError:
     logger.error("未找到tomli_w库，请安装tomli_w")
     raise ImportError("缺少tomli_w库，请使用pip安装tomli_w")
 
-from typing import Dict, Any, List
+# 可选的orjson，安装后用于加速JSON解析
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+from typing import Dict, Any, List, Union
 import asyncio
 import base64
+import bisect
+import concurrent.futures
+import contextlib
+import copy
+import tempfile
 from io import BytesIO
+from pathlib import Path
 from PIL import Image, ImageDraw, ImageFont
+import math
 import random
 import datetime
+import heapq
+import itertools
+import time
+from collections import OrderedDict, deque
 
 from WechatAPI import WechatAPIClient
 from utils.decorators import *
 from utils.plugin_base import PluginBase
 
 
+class ResponseTooLargeError(ValueError):
+    """响应体超过配置的大小上限"""
+
+
+class CircuitOpenError(aiohttp.ClientError):
+    """上游处于熔断状态，请求未发出即失败"""
+    
+    def __init__(self, target: str, retry_after: float):
+        super().__init__(f"{target} 已熔断，{retry_after:.0f}秒后重试")
+        self.target = target
+        self.retry_after = retry_after
+
+
+class ApiResponse:
+    """与连接解耦的上游响应快照，可以被缓存复用，也可以由合并请求的多个等待者共享
+    
+    refs为持有者数量，落盘的响应体在最后一个持有者释放时删除
+    """
+    
+    __slots__ = ("status", "headers", "body", "charset", "refs")
+    
+    def __init__(self, status: int, headers, body: Union[bytes, Path], charset: str = None):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.charset = charset
+        self.refs = 1
+    
+    def text(self) -> str:
+        """按响应声明的编码解码响应体"""
+        data = self.body.read_bytes() if isinstance(self.body, Path) else self.body
+        return data.decode(self.charset or "utf-8", errors="replace")
+    
+    def retain(self) -> "ApiResponse":
+        """增加一个持有者，返回自身"""
+        self.refs += 1
+        return self
+
+
+class LRUCache:
+    """基于OrderedDict的LRU缓存，超过容量时淘汰最久未使用的条目
+    
+    设置ttl后条目在写入ttl秒后过期，读取时惰性删除，写入时顺带清理队首的过期条目
+    """
+    
+    def __init__(self, max_entries: int, ttl: float = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+    
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None:
+            return default
+        value, expires_at = item
+        if expires_at is not None and time.monotonic() >= expires_at:
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+    
+    def put(self, key, value):
+        now = time.monotonic()
+        self._data[key] = (value, now + self.ttl if self.ttl else None)
+        self._data.move_to_end(key)
+        
+        # 清理队首已过期的条目
+        while self._data:
+            oldest_key, (_, expires_at) = next(iter(self._data.items()))
+            if expires_at is None or expires_at > now:
+                break
+            del self._data[oldest_key]
+        
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+    
+    def peek(self, key, default=None):
+        """读取未过期的条目，不改变淘汰顺序"""
+        item = self._data.get(key)
+        if item is None or (item[1] is not None and time.monotonic() >= item[1]):
+            return default
+        return item[0]
+    
+    def pop(self, key, default=None):
+        item = self._data.pop(key, None)
+        return default if item is None else item[0]
+    
+    def clear(self):
+        self._data.clear()
+    
+    def __contains__(self, key) -> bool:
+        return key in self._data
+    
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class CommandDispatcher:
+    """命令分发表，由内置命令、星座列表和api_config.toml中的API命令编译而成
+    
+    精确命令使用字典匹配，带参数的命令（如"短剧<关键词>"）使用前缀字典树匹配；
+    首字符不属于任何命令的消息在第一步就被拒绝。
+    """
+    
+    _END = "\0"
+    
+    def __init__(self):
+        self._exact = {}
+        self._trie = {}
+        self._first_chars = set()
+        self._digit_action = None
+    
+    def add_exact(self, text: str, action: str, arg=None):
+        """注册精确匹配的命令"""
+        self._exact[text] = (action, arg)
+        self._first_chars.add(text[0])
+    
+    def add_prefix(self, prefix: str, action: str):
+        """注册前缀命令，匹配时参数为前缀之后的剩余内容"""
+        node = self._trie
+        for ch in prefix:
+            node = node.setdefault(ch, {})
+        node[self._END] = action
+        self._first_chars.add(prefix[0])
+    
+    def add_digits(self, action: str):
+        """注册纯数字消息（如序号选择），参数为对应的整数"""
+        self._digit_action = action
+        self._first_chars.update("0123456789")
+    
+    def has_prefix(self, text: str) -> bool:
+        """检查文本是否会被某个前缀命令匹配"""
+        node = self._trie
+        for ch in text:
+            node = node.get(ch)
+            if node is None:
+                return False
+            if self._END in node:
+                return True
+        return False
+    
+    def match(self, content: str):
+        """匹配消息内容
+        
+        Returns:
+            (动作, 参数)，不是命令时返回None
+        """
+        if not content or content[0] not in self._first_chars:
+            return None
+        
+        hit = self._exact.get(content)
+        if hit is not None:
+            return hit
+        
+        # 最长前缀匹配
+        node = self._trie
+        found = None
+        for i, ch in enumerate(content):
+            node = node.get(ch)
+            if node is None:
+                break
+            if self._END in node:
+                found = (node[self._END], content[i + 1:])
+        if found is not None:
+            return found
+        
+        # isdigit()对"1²"等非ASCII数字也成立，但int()无法解析
+        if self._digit_action and content.isascii() and content.isdigit():
+            return (self._digit_action, int(content))
+        return None
+
+
+class CircuitBreaker:
+    """单个上游的熔断器与健康统计
+    
+    连续失败达到阈值后打开，打开期间请求直接失败；冷却时间过后进入半开状态，
+    只放行一个探测请求，探测成功则关闭，失败则重新打开。
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(self, failure_threshold: int, recovery_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.total_successes = 0
+        self.total_failures = 0
+        self.last_error = ""
+        self.opened_at = 0.0
+        self._probing = False
+    
+    def allow(self) -> bool:
+        """判断是否放行一个请求，半开状态同时只放行一个探测请求"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.recovery_timeout:
+                return False
+            self.state = self.HALF_OPEN
+        if self._probing:
+            return False
+        self._probing = True
+        return True
+    
+    def retry_after(self) -> float:
+        """距离允许下一次探测的剩余秒数"""
+        return max(0.0, self.opened_at + self.recovery_timeout - time.monotonic())
+    
+    def record_success(self):
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.total_successes += 1
+        self._probing = False
+    
+    def record_failure(self, error: str):
+        self.consecutive_failures += 1
+        self.total_failures += 1
+        self.last_error = error
+        self._probing = False
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+    
+    def release(self):
+        """请求被取消或因本地原因失败，既不算成功也不算失败"""
+        self._probing = False
+    
+    def is_open(self) -> bool:
+        """是否处于熔断打开且仍在冷却期内（不改变状态）"""
+        return self.state == self.OPEN and time.monotonic() - self.opened_at < self.recovery_timeout
+
+
+class RetryBudget:
+    """重试预算：每个原始请求补充ratio个令牌（不超过上限），每次重试或对冲消耗1个令牌
+    
+    上游整体故障时令牌很快耗尽，重试请求最多只占原始请求的ratio比例。
+    """
+    
+    def __init__(self, ratio: float, max_tokens: float):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+    
+    def deposit(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+    
+    def try_spend(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class LatencyWindow:
+    """最近若干次请求耗时的滑动窗口，用于估算分位数"""
+    
+    def __init__(self, size: int = 100):
+        self._samples = deque(maxlen=size)
+    
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+    
+    def percentile(self, q: float) -> float:
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    
+    def __len__(self) -> int:
+        return len(self._samples)
+
+
+class TokenBucket:
+    """令牌桶：按rate（个/秒）补充令牌，最多积攒burst个"""
+    
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def available(self) -> bool:
+        self._refill()
+        return self.tokens >= 1
+    
+    def take(self):
+        self.tokens -= 1
+    
+    def retry_after(self) -> float:
+        """距离下一个令牌还有多少秒"""
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+
+class EndpointStats:
+    """端点的EWMA耗时与错误率，用于负载均衡打分"""
+    
+    def __init__(self, alpha: float):
+        self.alpha = alpha
+        self.latency = 0.0
+        self.error_rate = 0.0
+        self.samples = 0
+    
+    def record(self, seconds: float, failed: bool):
+        error = 1.0 if failed else 0.0
+        if self.samples == 0:
+            self.latency, self.error_rate = seconds, error
+        else:
+            self.latency += self.alpha * (seconds - self.latency)
+            self.error_rate += self.alpha * (error - self.error_rate)
+        self.samples += 1
+    
+    def score(self, error_penalty: float) -> float:
+        """分数越低越优先；没有样本的端点分数为0，会被优先尝试"""
+        return self.latency + self.error_rate * error_penalty
+
+
+class InFlight:
+    """正在进行中的上游请求，相同请求的后来者等待同一个结果
+    
+    发起者被取消时以ABANDONED结束，等待者自行重新请求，而不是跟着被取消。
+    """
+    
+    __slots__ = ("future", "waiters")
+    
+    ABANDONED = object()
+    
+    def __init__(self):
+        self.future = asyncio.get_running_loop().create_future()
+        self.waiters = 0
+
+
+class CacheEntry:
+    """HTTP响应缓存条目，保存条件请求所需的校验信息"""
+    
+    __slots__ = ("response", "stored_at", "etag", "last_modified")
+    
+    def __init__(self, response: ApiResponse):
+        self.response = response
+        self.stored_at = time.monotonic()
+        self.etag = response.headers.get("ETag")
+        self.last_modified = response.headers.get("Last-Modified")
+
+
+class LatencyHistogram:
+    """固定分桶的耗时直方图，可估算分位数，也可直接导出为Prometheus格式"""
+    
+    BOUNDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+    
+    __slots__ = ("counts", "sum", "count")
+    
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.sum = 0.0
+        self.count = 0
+    
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+    
+    def quantile(self, q: float) -> float:
+        """在命中的桶内线性插值估算分位数，落在最后一个桶时返回最大边界"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                if i == len(self.BOUNDS):
+                    return self.BOUNDS[-1]
+                lower = self.BOUNDS[i - 1] if i else 0.0
+                return lower + (self.BOUNDS[i] - lower) * (rank - seen) / n
+            seen += n
+        return self.BOUNDS[-1]
+
+
+class FieldExtractor:
+    """按响应结构学习字段路径的提取器
+    
+    第一次遇到某种结构（顶层键集合及嵌套容器的键集合）时，按候选字段名、嵌套容器、
+    first_name+last_name组合和键名模糊匹配的顺序，找出该结构下每个字段所有可能的路径并缓存；
+    之后同结构的数据只按缓存的路径依次取值，取到第一个非空值为止。
+    """
+    
+    CONTAINERS = ("info", "data", "detail", "details")
+    NAME_PAIR = ("first_name", "last_name")
+    
+    def __init__(self, fields: Dict[str, tuple], max_shapes: int = 64):
+        """
+        Args:
+            fields: 字段名到(候选键名列表, 默认值)的映射
+            max_shapes: 最多缓存的结构数
+        """
+        self.fields = fields
+        self._paths = LRUCache(max_shapes)
+    
+    def _shape(self, data: dict) -> tuple:
+        nested = tuple((container, frozenset(data[container])) for container in self.CONTAINERS if isinstance(data.get(container), dict))
+        return (frozenset(data), nested)
+    
+    def _learn(self, data: dict) -> Dict[str, tuple]:
+        """为一种结构找出每个字段的候选路径"""
+        paths = {}
+        for field, (candidates, _) in self.fields.items():
+            found = [(name,) for name in candidates if name in data]
+            for container in self.CONTAINERS:
+                if isinstance(data.get(container), dict):
+                    found += [(container, name) for name in candidates if name in data[container]]
+            if all(name in data for name in self.NAME_PAIR):
+                found.append(self.NAME_PAIR)
+            lowered = [name.lower() for name in candidates]
+            found += [(key,) for key in data if any(name in str(key).lower() for name in lowered)]
+            paths[field] = tuple(dict.fromkeys(found))
+        return paths
+    
+    def extract(self, data) -> Dict[str, Any]:
+        """提取所有字段
+        
+        Args:
+            data: 一条结果数据
+            
+        Returns:
+            字段名到值的映射，取不到的字段为默认值
+        """
+        if not isinstance(data, dict):
+            return {field: default for field, (_, default) in self.fields.items()}
+        
+        shape = self._shape(data)
+        paths = self._paths.get(shape)
+        if paths is None:
+            paths = self._learn(data)
+            self._paths.put(shape, paths)
+        
+        values = {}
+        for field, (_, default) in self.fields.items():
+            values[field] = default
+            for path in paths[field]:
+                if path is self.NAME_PAIR:
+                    first, last = data[path[0]], data[path[1]]
+                    value = f"{first} {last}" if first and last else None
+                elif len(path) == 1:
+                    value = data[path[0]]
+                else:
+                    value = data[path[0]][path[1]]
+                if value:
+                    values[field] = value
+                    break
+        return values
+
+
+class OutboundMessage:
+    """出站队列中的一条待发送消息，媒体消息持有响应的一份引用直到发送结束"""
+    
+    __slots__ = ("bot", "to_wxid", "kind", "payload", "send_type", "priority", "attempts")
+    
+    # 数值越小越先发送：文字优先于图片，图片优先于视频
+    PRIORITIES = {"text": 0, "img": 1, "video": 2}
+    
+    def __init__(self, bot, to_wxid: str, kind: str, payload, send_type: str = "bytes"):
+        self.bot = bot
+        self.to_wxid = to_wxid
+        self.kind = kind
+        self.payload = payload
+        self.send_type = send_type
+        self.priority = self.PRIORITIES[kind]
+        self.attempts = 0
+
+
+def _b64encode_text(data) -> str:
+    """base64编码为文本，接受bytes或memoryview，不复制输入"""
+    return base64.b64encode(data).decode("ascii")
+
+
+def _b64encode_file(path: Path) -> str:
+    """读取文件并base64编码为文本，读取与编码都在调用线程中完成"""
+    return _b64encode_text(path.read_bytes())
+
+
+def _json_loads(data):
+    """解析JSON，安装了orjson时使用orjson"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(bytes(data) if isinstance(data, memoryview) else data)
+
+
+# 字符串整体匹配（跳过其中的括号），括号逐个匹配，其余字节由正则引擎在C层跳过
+_JSON_TOKEN = re.compile(rb'"(?:[^"\\]|\\.)*"|[{}\[\]]', re.DOTALL)
+# 可能是JSON开头的位置：对象后面紧跟键名或}，数组后面紧跟值或]
+_JSON_START = re.compile(rb'\{\s*["}]|\[\s*[\[{"\-0-9tfn\]]')
+_JSON_CLOSERS = {ord("}"): ord("{"), ord("]"): ord("[")}
+
+
+def _find_json_span(data: bytes, start: int = 0):
+    """从start开始找到第一个括号配对完整的JSON对象或数组
+    
+    Args:
+        data: 响应体
+        start: 开始扫描的位置
+        
+    Returns:
+        (起始位置, 结束位置)，找不到时返回None
+    """
+    stack = []
+    for match in _JSON_TOKEN.finditer(data, start):
+        char = data[match.start()]
+        if char == ord('"'):
+            continue
+        if char in _JSON_CLOSERS:
+            if not stack or stack.pop() != _JSON_CLOSERS[char]:
+                return None
+            if not stack:
+                return (start, match.end())
+        else:
+            stack.append(char)
+    return None
+
+
+def _parse_json_body(data: bytes, max_candidates: int = 64):
+    """解析JSON响应体，直接解析失败时从HTML等包装内容中找出第一个能解析的JSON对象或数组
+    
+    依次尝试每个像JSON开头的位置，括号配对完整且能解析就返回，最多尝试max_candidates个位置，
+    避免在病态页面上退化为平方级扫描。
+    
+    Args:
+        data: 响应体
+        max_candidates: 最多尝试的起始位置数
+        
+    Returns:
+        解析后的JSON数据
+        
+    Raises:
+        ValueError: 找不到可解析的JSON
+    """
+    try:
+        return _json_loads(data)
+    except ValueError:
+        pass
+    
+    view = memoryview(data)
+    position = 0
+    for _ in range(max_candidates):
+        candidate = _JSON_START.search(data, position)
+        if candidate is None:
+            break
+        span = _find_json_span(data, candidate.start())
+        if span is not None:
+            try:
+                return _json_loads(view[span[0]:span[1]])
+            except ValueError:
+                pass
+        position = candidate.start() + 1
+    raise ValueError("无法从响应中提取JSON数据")
+
+
+def _sniff_media(head: bytes) -> tuple:
+    """根据文件头的魔数识别媒体格式
+    
+    Args:
+        head: 响应体开头的至少16个字节
+        
+    Returns:
+        (类别, 格式)，类别为img或video；无法识别时返回(None, None)
+    """
+    if head.startswith(b"\xff\xd8\xff"):
+        return ("img", "jpeg")
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return ("img", "png")
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return ("img", "gif")
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ("img", "webp")
+    if head[:2] == b"BM":
+        return ("img", "bmp")
+    if head[4:8] == b"ftyp":
+        return ("video", "mov" if head[8:10] == b"qt" else "mp4")
+    if head.startswith(b"\x1a\x45\xdf\xa3"):
+        return ("video", "webm")
+    if head[:4] == b"RIFF" and head[8:12] == b"AVI ":
+        return ("video", "avi")
+    if head[:3] == b"FLV":
+        return ("video", "flv")
+    return (None, None)
+
+
+def _shrink_image(source, max_side: int, target_bytes: int, quality: int, min_quality: int) -> bytes:
+    """缩小图片尺寸并重新编码为JPEG，在进程池中执行
+    
+    Args:
+        source: 图片文件路径或图片数据
+        max_side: 长边像素上限
+        target_bytes: 目标大小(字节)，超过时逐步降低质量
+        quality: 初始JPEG质量
+        min_quality: JPEG质量下限
+        
+    Returns:
+        重新编码后的JPEG数据
+    """
+    img = Image.open(source if isinstance(source, str) else BytesIO(source))
+    img.thumbnail((max_side, max_side))
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    
+    while True:
+        buffer = BytesIO()
+        img.save(buffer, format="JPEG", quality=quality, optimize=True)
+        if buffer.tell() <= target_bytes or quality <= min_quality:
+            return buffer.getvalue()
+        quality = max(min_quality, quality - 10)
+
+
+def _render_test_image(text: str, bg_color: tuple, path: str):
+    """绘制测试图片并保存，在进程池中执行"""
+    img = Image.new('RGB', (400, 200), color=bg_color)
+    draw = ImageDraw.Draw(img)
+    text_color = (255 - bg_color[0], 255 - bg_color[1], 255 - bg_color[2])
+    
+    # 尝试加载字体，如果失败则使用默认字体
+    try:
+        font = ImageFont.truetype("arial.ttf", 20)
+        draw.text((20, 80), text, fill=text_color, font=font)
+    except:
+        draw.text((20, 80), text, fill=text_color)
+    
+    img.save(path)
+
+
+def _format_horoscope(data: dict) -> str:
+    """把星座运势接口的data格式化为回复文本"""
+    reply = f"✨ {data.get('title', '星座运势')} ✨\n"
+    reply += f"日期：{data.get('time', '未知')}\n"
+    reply += f"综合运势：{data.get('shortcomment', '未知')}\n"
+    reply += f"幸运数字：{data.get('luckynumber', '未知')}\n"
+    reply += f"幸运颜色：{data.get('luckycolor', '未知')}\n"
+    reply += f"幸运星座：{data.get('luckyconstellation', '未知')}\n"
+    reply += f"健康指数：{data.get('health', '未知')}\n"
+    reply += f"讨论指数：{data.get('discuss', '未知')}\n\n"
+    reply += "详细运势：\n"
+    reply += f"💫 整体运势：{data.get('alltext', '未知')}\n"
+    reply += f"💕 爱情运势：{data.get('lovetext', '未知')}\n"
+    reply += f"💼 事业运势：{data.get('worktext', '未知')}\n"
+    reply += f"💰 财运运势：{data.get('moneytext', '未知')}\n"
+    reply += f"🏃 健康运势：{data.get('healthtxt', '未知')}\n"
+    return reply
+
+
+def _parse_horoscope_date(text) -> datetime.date:
+    """从星座运势的time字段（如"2026-10-17"、"2026年10月17日"）中解析日期，无法解析时返回None"""
+    match = re.search(r"(\d{4})\D{1,3}(\d{1,2})\D{1,3}(\d{1,2})", str(text or ""))
+    if not match:
+        return None
+    try:
+        return datetime.date(*(int(part) for part in match.groups()))
+    except ValueError:
+        return None
+
+
+# 不以API名称分发、但实际调用某个API的动作，限流时按对应API的配置计
+ACTION_APIS = {
+    "fortune": "运势占卜",
+    "constellation": "星座",
+    "drama": "短剧",
+    "drama_more": "短剧",
+    "novel": "小说",
+    "novel_select": "小说",
+}
+
+# 小说结果中各字段可能使用的键名
+NOVEL_FIELDS = {
+    "title": (("title", "name", "bookname", "book_name", "novel_name", "novel_title"), "未知"),
+    "author": (("author", "writer", "auth", "aut", "creator", "作者"), "未知"),
+    "type": (("type", "category", "class", "genre", "tag", "tags", "分类", "类型"), "未知"),
+    "img": (("img", "cover", "image", "pic", "picture", "thumb", "封面"), ""),
+    "download": (("download", "link", "url", "download_url", "book_url", "下载链接"), ""),
+    "summary": (("js", "summary", "desc", "description", "intro", "introduction", "content", "简介"), "")
+}
+
+
 class APIInterface(PluginBase):
     description = "API接口插件，支持通过命令调用各种API接口"
     author = "Claude"
@@ -50,13 +755,65 @@ class APIInterface(PluginBase):
         self.config_path = os.path.join(os.path.dirname(__file__), "config.toml")
         self.api_config_path = os.path.join(os.path.dirname(__file__), "api_config.toml")
         self.command_map_path = os.path.join(os.path.dirname(__file__), "command_map.toml")
+        self.main_config_path = "main_config.toml"
         
         # 默认启用
         self.enable = True
         
+        # 搜索会话配置
+        self.session_config = {}
+        
+        # 配置热重载设置，以及已加载配置文件的修改时间
+        self.reload_config = {}
+        self._config_mtimes = {}
+        
+        # 配置持久化设置，以及等待防抖写入的配置文件
+        self.persist_config = {}
+        self.ratelimit_config = {}
+        self.outbox_config = {}
+        self.admission_config = {}
+        self.offload_config = {}
+        self.metrics_config = {}
+        self.horoscope_config = {}
+        self._pending_saves = set()
+        self._save_tasks = {}
+        
         # API接口配置
         self.api_configs = {}
         
+        # HTTP连接池配置
+        self.http_config = {}
+        
+        # 插件共享的HTTP会话，在async_init中创建，卸载时关闭
+        self._session = None
+        self._host_semaphores = {}
+        
+        # HTTP响应缓存配置
+        self.cache_config = {}
+        
+        # 熔断配置
+        self.breaker_config = {}
+        
+        # 重试与对冲配置
+        self.retry_config = {}
+        
+        # 媒体检查与压缩配置
+        self.media_config = {}
+        
+        # 插件持有的后台任务，卸载时统一取消
+        self._background_tasks = set()
+        
+        # CPU密集工作的线程池和进程池，首次使用时创建，卸载时关闭
+        self._thread_pool = None
+        self._process_pool = None
+        
+        # 生成过的测试图片(路径, 数据)
+        self._test_image = None
+        
+        # 运行指标：按(指标名, 标签)索引的耗时直方图和计数器
+        self._histograms = {}
+        self._counters = {}
+        
         # 命令映射
         self.commands = []
         
@@ -68,11 +825,75 @@ class APIInterface(PluginBase):
         self._load_api_config()
         self._load_command_map()
         
+        # 短剧/小说搜索会话，按(聊天, 发送者, 类型)索引，超过上限或过期后淘汰
+        self._search_sessions = LRUCache(self.session_config.get("max_sessions", 1000), self.session_config.get("ttl", 600))
+        
+        # HTTP响应缓存，按URL和参数索引
+        self._response_cache = LRUCache(self.cache_config.get("max_entries", 512))
+        self._cache_stats = {}
+        self._revalidating = set()
+        
+        # 按上游划分的熔断器和重试预算，按接口地址统计的近期耗时
+        self._breakers = {}
+        self._retry_budgets = {}
+        self._latency_windows = {}
+        self._hedge_stats = {}
+        self._endpoint_stats = {}
+        
+        # 进行中的上游请求，用于合并相同的并发请求
+        self._inflight = {}
+        self._coalesce_stats = {}
+        
+        # 小说结果的字段提取器，按结果结构缓存字段路径
+        self._novel_fields = FieldExtractor(NOVEL_FIELDS)
+        
+        # 随机媒体命令的预取缓冲，按API命令名索引
+        self._prefetch_pools = {}
+        self._prefetch_tasks = {}
+        self._prefetch_retry_at = {}
+        self._prefetch_stats = {}
+        
+        # 小说详情后台预取的全局并发上限，首次使用时创建
+        self._detail_semaphore = None
+        
+        # 预热好的星座运势回复，星座名 -> (上游日期, 回复文本)
+        self._horoscopes = {}
+        
+        # 限流令牌桶，按(范围, wxid, 预算名)索引；被限流者的提示记录，提示间隔内不重复提示
+        max_buckets = self.ratelimit_config.get("max_buckets", 10000)
+        self._rate_buckets = LRUCache(max_buckets)
+        self._throttle_notices = LRUCache(max_buckets, self.ratelimit_config.get("notice_interval", 60))
+        
+        # 命令工作队列：固定数量的工作协程处理命令，管理命令走优先通道
+        self._work_queue = deque()
+        self._admin_work_queue = deque()
+        self._work_available = asyncio.Event()
+        self._workers = []
+        self._shed_count = 0
+        
+        # 出站消息队列：每个接收者一个先进先出队列，就绪的接收者按队首消息的优先级排队
+        self._outbox = {}
+        self._outbox_ready = []
+        self._outbox_seq = itertools.count()
+        self._outbox_size = 0
+        self._outbox_bucket = None
+        self._outbox_chat_next = LRUCache(10000)
+        self._outbox_workers = []
+        self._outbox_wakeup = asyncio.Event()
+        self._outbox_space = asyncio.Event()
+        
         # 加载白名单配置
-        self.whitelist = []
+        self.whitelist = frozenset()
         self.ignore_mode = ""
         self._load_whitelist()
         
+        # 记录配置文件当前的修改时间，作为热重载的基准
+        for path in self._watched_config_files():
+            self._config_mtimes[path] = self._config_mtime(path)
+        
+        # 编译命令分发表
+        self._build_dispatcher()
+        
     def _load_config(self):
         """加载插件配置"""
         try:
@@ -83,10 +904,40 @@ class APIInterface(PluginBase):
                 # 读取基本配置
                 basic_config = config.get("basic", {})
                 self.enable = basic_config.get("enable", True)
+                self.session_config = config.get("session", {})
+                self.reload_config = config.get("reload", {})
+                self.persist_config = config.get("persist", {})
+                self.ratelimit_config = config.get("ratelimit", {})
+                self.outbox_config = config.get("outbox", {})
+                self.admission_config = config.get("admission", {})
+                self.offload_config = config.get("offload", {})
+                self.metrics_config = config.get("metrics", {})
+                self.horoscope_config = config.get("horoscope", {})
             else:
                 # 创建默认配置
-                with open(self.config_path, "wb") as f:
-                    tomli_w.dump({"basic": {"enable": True}}, f)
+                self._write_toml_atomic(self.config_path, {
+                    "basic": {"enable": True},
+                    "session": {
+                        "max_sessions": 1000, "ttl": 600, "page_bytes": 2000, "drama_page_items": 5, "novel_page_items": 15,
+                        "detail_prefetch": 5, "detail_concurrency": 2
+                    },
+                    "reload": {"enable": True, "interval": 5},
+                    "persist": {"debounce": 1.0},
+                    "ratelimit": {
+                        "enable": True,
+                        "notice_interval": 60,
+                        "heavy": {"user": {"rate": 0.1, "burst": 3}, "chat": {"rate": 0.2, "burst": 6}},
+                        "light": {"user": {"rate": 0.5, "burst": 5}, "chat": {"rate": 1, "burst": 10}}
+                    },
+                    "outbox": {"workers": 2, "chat_interval": 1.0, "rate": 20, "burst": 40, "max_attempts": 3, "retry_delay": 2, "max_pending": 500},
+                    "admission": {"workers": 8, "max_queue": 64},
+                    "offload": {"threads": 4, "processes": 1, "threshold": 262144},
+                    "metrics": {"textfile": "", "interval": 15},
+                    "horoscope": {
+                        "enable": True, "utc_offset": 8, "rollover": "00:05", "jitter": 300,
+                        "concurrency": 3, "retry_delay": 300, "retry_until": "07:00"
+                    }
+                })
         except Exception as e:
             logger.error(f"加载APIInterface配置文件失败: {str(e)}")
     
@@ -98,6 +949,11 @@ class APIInterface(PluginBase):
                 with open(self.api_config_path, "rb") as f:
                     config = tomllib.load(f)
                     self.api_configs = config.get("api", {})
+                    self.http_config = config.get("http", {})
+                    self.cache_config = config.get("cache", {})
+                    self.breaker_config = config.get("breaker", {})
+                    self.retry_config = config.get("retry", {})
+                    self.media_config = config.get("media", {})
             else:
                 # 创建默认API配置
                 self._create_default_config()
@@ -155,6 +1011,22 @@ class APIInterface(PluginBase):
                 "admin_only": True,
                 "prefix_required": False
             },
+            {
+                "name": "API状态",
+                "description": "查看各API的耗时分位数、上游状态码、流量和缓存命中情况",
+                "usage": "API状态",
+                "hidden": False,
+                "admin_only": True,
+                "prefix_required": False
+            },
+            {
+                "name": "发送诊断",
+                "description": "测量测试图片生成、各发送方式和各API上游往返的耗时",
+                "usage": "发送诊断",
+                "hidden": False,
+                "admin_only": True,
+                "prefix_required": False
+            },
             {
                 "name": "运势占卜",
                 "description": "随机获取运势占卜图片",
@@ -197,6 +1069,13 @@ class APIInterface(PluginBase):
                 "hidden": True,
                 "prefix_required": False
             },
+            {
+                "name": "下一页",
+                "description": "显示短剧/小说搜索结果的下一页",
+                "usage": "下一页",
+                "hidden": False,
+                "prefix_required": False
+            },
             {
                 "name": "小说",
                 "description": "搜索小说",
@@ -209,14 +1088,59 @@ class APIInterface(PluginBase):
         self.commands = default_commands
         
         try:
-            with open(self.command_map_path, "wb") as f:
-                tomli_w.dump({"commands": default_commands}, f)
+            self._write_toml_atomic(self.command_map_path, {"commands": default_commands})
             logger.success("已创建默认命令映射")
         except Exception as e:
             logger.error(f"创建默认命令映射失败: {str(e)}")
     
     def _create_default_config(self):
         """创建默认API配置"""
+        self.http_config = {
+            "limit": 100,
+            "limit_per_host": 10,
+            "keepalive_timeout": 30,
+            "dns_cache_ttl": 300,
+            "timeout": 15,
+            "coalesce": True,
+            "media_timeout": 120,
+            "prefetch_retry_delay": 30,
+            "balance_alpha": 0.3,
+            "balance_error_penalty": 5,
+            "max_media_bytes": 50 * 1024 * 1024,
+            "max_json_bytes": 2 * 1024 * 1024,
+            "spool_bytes": 2 * 1024 * 1024,
+            "host_limits": {}
+        }
+        self.cache_config = {
+            "enabled": True,
+            "max_entries": 512,
+            "max_entry_bytes": 1024 * 1024,
+            "default_ttl": 0
+        }
+        self.breaker_config = {
+            "enabled": True,
+            "scope": "host",
+            "failure_threshold": 5,
+            "recovery_timeout": 30
+        }
+        self.retry_config = {
+            "attempts": 1,
+            "backoff": 0.3,
+            "max_backoff": 3,
+            "retry_statuses": [502, 503, 504],
+            "budget_ratio": 0.2,
+            "budget_max": 10,
+            "hedge_min_samples": 20,
+            "hedge_min_delay": 0.3
+        }
+        self.media_config = {
+            "enabled": True,
+            "min_bytes": 100,
+            "max_image_bytes": 2 * 1024 * 1024,
+            "max_image_side": 2048,
+            "quality": 85,
+            "min_quality": 60
+        }
         self.api_configs = {
             "18+": {
                 "url": "https://laterouapi.tonghang.fun/api/R18_2",
@@ -234,84 +1158,270 @@ class APIInterface(PluginBase):
                 "url": "https://www.hhlqilongzhu.cn/api/tu_yunshi.php",
                 "method": "get",
                 "return_type": "img",
-                "description": "随机获取运势占卜图片"
+                "description": "随机获取运势占卜图片",
+                "cache": False,
+                "coalesce": False,
+                "prefetch": 2
             }
         }
         self._save_api_config()
     
     def _save_api_config(self):
-        """保存API接口配置"""
+        """保存API接口配置（同步写入，仅用于初始化阶段；运行中请使用_schedule_save）"""
         try:
-            os.makedirs(os.path.dirname(self.api_config_path), exist_ok=True)
-            
-            # 构建配置
-            config = {"api": self.api_configs}
-            
-            # 保存为TOML格式
-            with open(self.api_config_path, "wb") as f:
-                tomli_w.dump(config, f)
+            self._write_toml_atomic(self.api_config_path, self._api_config_document())
             logger.info("API配置已保存到TOML文件")
         except Exception as e:
             logger.error(f"保存API配置文件失败: {str(e)}")
     
     def _save_command_map(self):
-        """保存命令映射"""
+        """保存命令映射（同步写入，仅用于初始化阶段；运行中请使用_schedule_save）"""
         try:
-            os.makedirs(os.path.dirname(self.command_map_path), exist_ok=True)
-            
-            # 构建配置
-            config = {"commands": self.commands}
-            
-            # 保存为TOML格式
-            with open(self.command_map_path, "wb") as f:
-                tomli_w.dump(config, f)
+            self._write_toml_atomic(self.command_map_path, self._command_map_document())
             logger.info("命令映射已保存到TOML文件")
         except Exception as e:
             logger.error(f"保存命令映射失败: {str(e)}")
     
-    async def async_init(self):
-        """异步初始化"""
-        pass
+    def _api_config_document(self) -> dict:
+        """构建api_config.toml的内容"""
+        return {"http": self.http_config, "cache": self.cache_config, "breaker": self.breaker_config, "retry": self.retry_config,
+                "media": self.media_config, "api": self.api_configs}
     
-    def _get_command_config(self, command_name: str) -> dict:
-        """获取命令配置
-        
-        Args:
-            command_name: 命令名称
-            
-        Returns:
-            命令配置字典，如果命令不存在则返回空字典
-        """
-        for command in self.commands:
-            if command.get("name") == command_name:
-                return command
-        return {}
+    def _command_map_document(self) -> dict:
+        """构建command_map.toml的内容"""
+        return {"commands": self.commands}
     
-    def _is_command_admin_only(self, command_name: str) -> bool:
-        """检查命令是否仅限管理员使用
+    def _write_toml_atomic(self, path: str, document: dict):
+        """先写临时文件再原子重命名，写入中途崩溃不会损坏原文件
         
         Args:
-            command_name: 命令名称
-            
-        Returns:
-            是否仅限管理员使用
+            path: 目标文件路径
+            document: 要写入的TOML内容
         """
-        command_config = self._get_command_config(command_name)
-        return command_config.get("admin_only", False)
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                tomli_w.dump(document, f)
+                f.flush()
+                os.fsync(f.fileno())
+            # mkstemp创建的文件权限为0600，沿用原文件的权限
+            try:
+                mode = stat.S_IMODE(os.stat(path).st_mode)
+            except FileNotFoundError:
+                mode = 0o644
+            os.chmod(temp_path, mode)
+            os.replace(temp_path, path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.unlink(temp_path)
+            raise
+        
+        # 自己写入的变化不触发热重载
+        self._config_mtimes[path] = self._config_mtime(path)
     
-    def _is_command_hidden(self, command_name: str) -> bool:
-        """检查命令是否隐藏
+    def _schedule_save(self, path: str):
+        """防抖保存配置文件
+        
+        短时间内的多次修改（例如连续添加/删除API）合并为一次写入，
+        写入时在事件循环中拍下配置快照，序列化和磁盘I/O放到线程池中执行。
         
         Args:
-            command_name: 命令名称
-            
-        Returns:
-            是否隐藏
+            path: api_config_path或command_map_path
         """
-        command_config = self._get_command_config(command_name)
-        return command_config.get("hidden", False)
+        self._pending_saves.add(path)
+        if path not in self._save_tasks:
+            self._save_tasks[path] = self._spawn(self._flush_save_later(path))
     
-    def _get_command_usage(self, command_name: str) -> str:
+    async def _flush_save_later(self, path: str):
+        """等待防抖时间后写入配置，写入期间又有修改时再写一次"""
+        try:
+            while path in self._pending_saves:
+                await asyncio.sleep(self.persist_config.get("debounce", 1.0))
+                await self._flush_save(path)
+        finally:
+            self._save_tasks.pop(path, None)
+    
+    async def _flush_save(self, path: str):
+        """立即写入一个待保存的配置文件"""
+        if path not in self._pending_saves:
+            return
+        self._pending_saves.discard(path)
+        
+        builders = {self.api_config_path: self._api_config_document, self.command_map_path: self._command_map_document}
+        # 深拷贝出快照，避免后台线程序列化时配置被并发修改
+        document = copy.deepcopy(builders[path]())
+        try:
+            await self._offload(self._write_toml_atomic, path, document)
+            logger.info(f"配置已保存: {os.path.basename(path)}")
+        except Exception as e:
+            logger.error(f"保存配置文件失败 {path}: {str(e)}")
+    
+    async def async_init(self):
+        """异步初始化"""
+        await self._get_session()
+        
+        # 清理上次异常退出时遗留的落盘响应体
+        await self._offload(self._sweep_spool_files)
+        
+        # 启动配置文件热重载
+        if self.reload_config.get("enable", True):
+            self._spawn(self._watch_config_files())
+        
+        # 填充随机媒体命令的预取缓冲
+        for cmd in self.api_configs:
+            self._ensure_prefetch(cmd)
+        
+        # 定期导出Prometheus文本格式的指标文件
+        if self.metrics_config.get("textfile"):
+            self._spawn(self._export_metrics_periodically())
+        
+        # 每天上游换日后预热12星座运势
+        if self.horoscope_config.get("enable", True):
+            self._spawn(self._warm_horoscopes_daily())
+    
+    async def on_disable(self):
+        """插件禁用/卸载时写入待保存的配置，取消后台任务，丢弃未发出的消息并关闭共享HTTP会话"""
+        await super().on_disable()
+        for path in list(self._pending_saves):
+            await self._flush_save(path)
+        for task in list(self._background_tasks):
+            task.cancel()
+        self._background_tasks.clear()
+        self._outbox_workers = []
+        self._workers = []
+        self._work_queue.clear()
+        self._admin_work_queue.clear()
+        self._clear_outbox()
+        self._clear_prefetch_pools()
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._host_semaphores = {}
+        self._shutdown_executors()
+    
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """获取插件共享的HTTP会话，不存在或已关闭时重新创建
+        
+        Returns:
+            复用连接的aiohttp.ClientSession
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.http_config.get("limit", 100),
+                limit_per_host=self.http_config.get("limit_per_host", 10),
+                ttl_dns_cache=self.http_config.get("dns_cache_ttl", 300),
+                keepalive_timeout=self.http_config.get("keepalive_timeout", 30)
+            )
+            timeout = aiohttp.ClientTimeout(total=self.http_config.get("timeout", 15))
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout, trace_configs=[self._trace_config()])
+            logger.info("已创建共享HTTP会话")
+        return self._session
+    
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        """记录新建连接耗时的请求跟踪配置，结果写入请求时传入的trace_request_ctx字典"""
+        trace_config = aiohttp.TraceConfig()
+        
+        async def on_connection_create_start(session, context, params):
+            context.connect_started = time.monotonic()
+        
+        async def on_connection_create_end(session, context, params):
+            if isinstance(context.trace_request_ctx, dict):
+                context.trace_request_ctx["connect"] = time.monotonic() - context.connect_started
+        
+        trace_config.on_connection_create_start.append(on_connection_create_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        return trace_config
+    
+    def _host_slot(self, url: str):
+        """获取目标主机的并发限制上下文
+        
+        Args:
+            url: 请求地址
+            
+        Returns:
+            该主机配置了并发上限时返回信号量，否则返回空上下文
+        """
+        host = urllib.parse.urlsplit(url).hostname or ""
+        host_limits = self.http_config.get("host_limits", {})
+        if host not in host_limits:
+            return contextlib.nullcontext()
+        
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(int(host_limits[host]))
+            self._host_semaphores[host] = semaphore
+        return semaphore
+    
+    def _build_dispatcher(self):
+        """根据命令映射和API配置编译命令分发表，配置变化后需重新调用"""
+        dispatcher = CommandDispatcher()
+        
+        # 带参数的命令
+        dispatcher.add_prefix("短剧", "drama")
+        dispatcher.add_prefix("小说", "novel")
+        dispatcher.add_prefix("添加API ", "add_api")
+        dispatcher.add_prefix("删除API ", "remove_api")
+        dispatcher.add_prefix("API列表", "list_api")
+        dispatcher.add_digits("novel_select")
+        
+        # 通用API命令，会被前缀命令截获的名称无法触发，跳过
+        for cmd in self.api_configs:
+            if cmd and not dispatcher.has_prefix(cmd):
+                dispatcher.add_exact(cmd, "api", cmd)
+        
+        # 内置命令优先于同名的通用API命令
+        dispatcher.add_exact("测试图片", "test_image")
+        dispatcher.add_exact("发送诊断", "diagnose")
+        dispatcher.add_exact("API状态", "stats")
+        for constellation in self.constellations:
+            dispatcher.add_exact(constellation, "constellation", constellation)
+        dispatcher.add_exact("运势占卜", "fortune")
+        dispatcher.add_exact("运势", "fortune")
+        dispatcher.add_exact("显示剩余", "drama_more")
+        dispatcher.add_exact("下一页", "next_page")
+        
+        self._dispatcher = dispatcher
+        self._command_index = {command.get("name"): command for command in self.commands}
+    
+    def _get_command_config(self, command_name: str) -> dict:
+        """获取命令配置
+        
+        Args:
+            command_name: 命令名称
+            
+        Returns:
+            命令配置字典，如果命令不存在则返回空字典
+        """
+        return self._command_index.get(command_name, {})
+    
+    def _is_command_admin_only(self, command_name: str) -> bool:
+        """检查命令是否仅限管理员使用
+        
+        Args:
+            command_name: 命令名称
+            
+        Returns:
+            是否仅限管理员使用
+        """
+        command_config = self._get_command_config(command_name)
+        return command_config.get("admin_only", False)
+    
+    def _is_command_hidden(self, command_name: str) -> bool:
+        """检查命令是否隐藏
+        
+        Args:
+            command_name: 命令名称
+            
+        Returns:
+            是否隐藏
+        """
+        command_config = self._get_command_config(command_name)
+        return command_config.get("hidden", False)
+    
+    def _get_command_usage(self, command_name: str) -> str:
         """获取命令使用说明
         
         Args:
@@ -339,18 +1449,142 @@ class APIInterface(PluginBase):
         """从main_config.toml加载白名单配置"""
         try:
             # 读取主配置文件
-            with open("main_config.toml", "rb") as f:
+            with open(self.main_config_path, "rb") as f:
                 main_config = tomllib.load(f)
             
             # 获取白名单
-            xybot_config = main_config.get("XYBot", {})
-            self.whitelist = xybot_config.get("whitelist", [])
-            self.ignore_mode = xybot_config.get("ignore-mode", "")
+            self.whitelist, self.ignore_mode = self._parse_whitelist(main_config)
             
             logger.info(f"已加载白名单({len(self.whitelist)}个)，当前模式: {self.ignore_mode}")
         except Exception as e:
             logger.error(f"加载白名单配置失败: {str(e)}")
-            self.whitelist = []
+            self.whitelist = frozenset()
+    
+    def _parse_whitelist(self, main_config: dict) -> tuple:
+        """从主配置中解析白名单
+        
+        Args:
+            main_config: main_config.toml的内容
+            
+        Returns:
+            (白名单集合, ignore-mode)
+        """
+        xybot_config = main_config.get("XYBot", {})
+        return frozenset(xybot_config.get("whitelist", [])), xybot_config.get("ignore-mode", "")
+    
+    def _watched_config_files(self) -> List[str]:
+        """需要热重载的配置文件"""
+        return [self.api_config_path, self.command_map_path, self.main_config_path]
+    
+    def _config_mtime(self, path: str):
+        """获取文件修改时间，文件不存在时返回None"""
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+    
+    def _read_toml(self, path: str) -> dict:
+        """读取并解析TOML文件，供后台线程调用"""
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    
+    async def _watch_config_files(self):
+        """轮询配置文件的修改时间，发现变化后重新加载"""
+        interval = self.reload_config.get("interval", 5)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self._reload_changed_configs()
+            except Exception as e:
+                logger.error(f"热重载配置失败: {str(e)}")
+    
+    async def _reload_changed_configs(self):
+        """在后台线程中重新解析有变化的配置文件，解析全部成功后整体替换当前配置"""
+        parsed = {}
+        for path in self._watched_config_files():
+            mtime = self._config_mtime(path)
+            if mtime is None or mtime == self._config_mtimes.get(path):
+                continue
+            
+            # 无论成败都记录修改时间，避免对同一个损坏的文件反复报错
+            self._config_mtimes[path] = mtime
+            try:
+                parsed[path] = await self._offload(self._read_toml, path)
+            except Exception as e:
+                logger.error(f"解析配置文件失败，继续使用当前配置 {path}: {str(e)}")
+        
+        if parsed:
+            self._apply_config_snapshot(parsed)
+    
+    def _apply_config_snapshot(self, parsed: Dict[str, dict]):
+        """用新解析的配置替换当前配置
+        
+        先在局部变量中准备好全部新配置，再在一个同步代码块中替换，
+        期间不会让出事件循环，其他协程看不到新旧配置混杂的中间状态。
+        
+        Args:
+            parsed: 配置文件路径到解析结果的映射
+        """
+        api_configs, http_config, cache_config = self.api_configs, self.http_config, self.cache_config
+        breaker_config, retry_config, media_config = self.breaker_config, self.retry_config, self.media_config
+        commands = self.commands
+        whitelist, ignore_mode = self.whitelist, self.ignore_mode
+        
+        if self.api_config_path in parsed:
+            config = parsed[self.api_config_path]
+            api_configs = config.get("api", {})
+            http_config = config.get("http", {})
+            cache_config = config.get("cache", {})
+            breaker_config = config.get("breaker", {})
+            retry_config = config.get("retry", {})
+            media_config = config.get("media", {})
+        if self.command_map_path in parsed:
+            commands = parsed[self.command_map_path].get("commands", [])
+        if self.main_config_path in parsed:
+            whitelist, ignore_mode = self._parse_whitelist(parsed[self.main_config_path])
+        
+        http_changed = http_config != self.http_config
+        api_changed = api_configs != self.api_configs or media_config != self.media_config
+        
+        self.api_configs, self.http_config, self.cache_config = api_configs, http_config, cache_config
+        self.media_config = media_config
+        if breaker_config != self.breaker_config:
+            # 阈值或划分方式变化后重新统计
+            self.breaker_config = breaker_config
+            self._breakers = {}
+            self._retry_budgets = {}
+        if retry_config != self.retry_config:
+            self.retry_config = retry_config
+            self._retry_budgets = {}
+        self.commands = commands
+        self.whitelist, self.ignore_mode = whitelist, ignore_mode
+        self._response_cache.max_entries = cache_config.get("max_entries", 512)
+        self._build_dispatcher()
+        if http_changed:
+            self._retire_session()
+        if api_changed:
+            # API地址或参数可能已变化，丢弃旧的预取结果后重新填充
+            self._clear_prefetch_pools()
+            for cmd in self.api_configs:
+                self._ensure_prefetch(cmd)
+        
+        logger.success(f"已热重载配置: {', '.join(os.path.basename(path) for path in parsed)}")
+    
+    def _retire_session(self):
+        """连接池配置变化后换用新的HTTP会话，旧会话等进行中的请求结束后再关闭"""
+        old_session = self._session
+        self._session = None
+        self._host_semaphores = {}
+        if old_session is None or old_session.closed:
+            return
+        
+        async def close_later():
+            try:
+                await asyncio.sleep(self.http_config.get("media_timeout", 120))
+            finally:
+                await old_session.close()
+        
+        self._spawn(close_later())
             
     def _is_in_whitelist(self, wxid: str) -> bool:
         """检查wxid是否在白名单中
@@ -366,11 +1600,7 @@ class APIInterface(PluginBase):
             return True
             
         # 检查是否在白名单中
-        for item in self.whitelist:
-            if item == wxid:
-                return True
-                
-        return False
+        return wxid in self.whitelist
 
     @on_text_message(priority=50)
     async def handle_text(self, bot: WechatAPIClient, message: dict):
@@ -384,528 +1614,2137 @@ class APIInterface(PluginBase):
         sender_wxid = message.get("SenderWxid", "")
         is_group = message.get("IsGroup", False)
         
+        # 处理格式为"wxid_xxx: 命令"的情况，提取真正的命令内容
+        if content.startswith("wxid_") and ":" in content:
+            parts = content.split(":", 1)
+            if len(parts) == 2 and parts[0].strip().startswith("wxid_"):
+                content = parts[1].strip()
+                logger.info(f"提取到实际命令内容: {content}")
+        
+        # 先查分发表，不是本插件命令的消息直接放行，不做其他处理
+        route = self._dispatcher.match(content)
+        if route is None:
+            return True
+        action, arg = route
+        
         # 白名单检查
         if not self._is_in_whitelist(from_wxid):
             # 对于非白名单群聊/用户，直接忽略，允许其他插件处理
             logger.info(f"忽略非白名单的消息: {from_wxid}")
             return True
         
-        # 处理格式为"wxid_xxx: 命令"的情况，提取真正的命令内容
-        if ":" in content:
-            parts = content.split(":", 1)
-            if len(parts) == 2 and parts[0].strip().startswith("wxid_"):
-                content = parts[1].strip()
-                logger.info(f"提取到实际命令内容: {content}")
+        # 序号选择仅在当前聊天中该用户有未过期的小说搜索时生效，其他数字消息不计入限流
+        if action == "novel_select" and not self._search_sessions.get(self._session_key(message, "novel")):
+            return True
+        # "下一页"同理，仅在该用户有未过期的搜索会话时生效
+        if action == "next_page" and not self._search_sessions.get(self._session_key(message, "last")):
+            return True
         
-        # 测试图片发送功能
-        if content == "测试图片":
-            await self._send_test_image(bot, from_wxid)
-            return True  # 修改：允许其他插件处理
+        # 限流检查，在发起任何上游请求之前进行
+        if not await self._check_rate_limit(bot, message, action, arg):
+            return True
         
-        # 直接处理星座运势请求，不需要前缀
-        constellation_match = None
-        for constellation in self.constellations:
-            if content == constellation:
-                constellation_match = constellation
-                break
-                
-        if constellation_match:
-            await self._handle_constellation(bot, message, constellation_match)
-            return True  # 修改：允许其他插件处理
+        # 交给工作队列处理，队列已满时直接拒绝
+        await self._admit(bot, message, action, arg)
+        return True  # 修改：无论是否匹配，都允许其他插件处理
+    
+    async def _admit(self, bot: WechatAPIClient, message: dict, action: str, arg):
+        """把命令放入工作队列
+        
+        管理员发送的管理命令进入不限长度的优先通道；其他命令（包括非管理员发送的管理命令）
+        进入有界队列，队列满时立即回复繁忙提示，同一发送者在notice_interval内只提示一次。
+        
+        Args:
+            bot: 机器人实例
+            message: 消息字典
+            action: 分发表动作
+            arg: 动作参数
+        """
+        if not self._workers:
+            count = max(1, self.admission_config.get("workers", 8))
+            self._workers = [self._spawn(self._command_worker()) for _ in range(count)]
+        
+        job = (bot, message, action, arg, time.monotonic())
+        if action in ("add_api", "remove_api", "list_api", "diagnose", "stats") and self._is_admin_message(message):
+            self._admin_work_queue.append(job)
+        elif len(self._work_queue) < self.admission_config.get("max_queue", 64):
+            self._work_queue.append(job)
+        else:
+            self._shed_count += 1
+            from_wxid = message.get("FromWxid", "")
+            sender_wxid = message.get("SenderWxid", "") or from_wxid
+            logger.warning(f"工作队列已满，拒绝请求: {action} {sender_wxid}@{from_wxid}")
+            notice_key = (from_wxid, sender_wxid, "busy")
+            if self._throttle_notices.get(notice_key) is None:
+                self._throttle_notices.put(notice_key, True)
+                await self._send_text(bot, from_wxid, "⚠️ 当前请求较多，请稍后再试")
+            return
+        self._work_available.set()
+    
+    async def _command_worker(self):
+        """工作协程：优先处理管理命令，再按到达顺序处理普通命令"""
+        while True:
+            while not (self._admin_work_queue or self._work_queue):
+                self._work_available.clear()
+                await self._work_available.wait()
+            queue = self._admin_work_queue or self._work_queue
+            bot, message, action, arg, enqueued_at = queue.popleft()
+            command = arg if action == "api" else action
+            started = time.monotonic()
+            self._observe("apiinterface_queue_wait_seconds", (("command", command),), started - enqueued_at)
+            try:
+                await self._run_action(bot, message, action, arg)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._count("apiinterface_command_errors_total", (("command", command),))
+                logger.error(f"处理命令失败: {action}: {str(e)}")
+            finally:
+                self._observe("apiinterface_command_duration_seconds", (("command", command),), time.monotonic() - started)
+    
+    async def _run_action(self, bot: WechatAPIClient, message: dict, action: str, arg):
+        """执行分发表匹配到的命令"""
+        from_wxid = message.get("FromWxid", "")
         
-        # 处理运势占卜命令
-        if content == "运势占卜" or content == "运势":
+        if action == "test_image":
+            # 测试图片发送功能
+            await self._send_test_image(bot, from_wxid)
+        elif action == "constellation":
+            # 直接处理星座运势请求，不需要前缀
+            await self._handle_constellation(bot, message, arg)
+        elif action == "fortune":
+            # 处理运势占卜命令
             logger.info(f"收到运势占卜请求")
             api_config = self.api_configs.get("运势占卜")
             if api_config:
                 await self._call_api(bot, from_wxid, "运势占卜", api_config)
             else:
                 logger.error("运势占卜接口未配置")
-                await bot.send_text_message(from_wxid, "运势占卜功能暂不可用，请联系管理员")
+                await self._send_text(bot, from_wxid, "运势占卜功能暂不可用，请联系管理员")
+        elif action == "drama":
+            # 直接处理短剧搜索请求，不需要前缀
+            params = arg.strip()
+            if params:
+                await self._handle_drama(bot, message, params)
+            else:
+                await self._send_text(bot, from_wxid, "请指定搜索关键词，例如：短剧总裁")
+        elif action == "drama_more":
+            # "显示剩余"保留为短剧翻页的别名
+            await self._handle_next_page(bot, message, "drama")
+        elif action == "next_page":
+            # 翻到最近一次搜索的下一页
+            await self._handle_next_page(bot, message)
+        elif action == "novel":
+            # 处理小说搜索请求
+            params = arg.strip()
+            if params:
+                await self._handle_novel(bot, message, params)
+            else:
+                await self._send_text(bot, from_wxid, "请指定搜索关键词，例如：小说总裁")
+        elif action == "novel_select":
+            # 处理小说序号选择
+            await self._handle_novel_selection(bot, message, arg)
+        elif action == "diagnose":
+            await self._run_diagnostics(bot, message)
+        elif action == "stats":
+            await self._show_stats(bot, message)
+        elif action == "add_api":
+            # 处理管理命令，无需@机器人
+            await self._add_api(bot, message)
+        elif action == "remove_api":
+            await self._remove_api(bot, message)
+        elif action == "list_api":
+            await self._list_api(bot, message)
+        elif action == "api":
+            # API调用指令
+            api_config = self.api_configs.get(arg)
+            if api_config:
+                logger.info(f"收到API调用指令: {arg}")
+                await self._call_api(bot, from_wxid, arg, api_config)
+
+    def _rate_limit_rules(self, action: str, arg, message: dict = None) -> tuple:
+        """确定命令使用的限流预算
+        
+        API可用ratelimit指定"heavy"/"light"档位、自定义{user, chat}规则或false关闭限流；
+        未指定时返回图片/视频的API按heavy计，其他命令（包括非管理员发送的管理命令）按light计。
+        短剧、小说、星座等动作按其背后的API计，"下一页"按最近一次搜索的类型计。
+        
+        Args:
+            action: 分发表动作
+            arg: 动作参数
+            message: 消息数据，用于确定"下一页"翻的是哪种搜索
+            
+        Returns:
+            (预算名, {范围: {rate, burst}})，不限流时返回None
+        """
+        if action == "next_page":
+            last = self._search_sessions.peek(self._session_key(message, "last")) if message else None
+            action = "drama_more" if last == "drama" else "novel"
+        if action in ACTION_APIS:
+            action, arg = "api", ACTION_APIS[action]
+        
+        if action == "api":
+            api_config = self.api_configs.get(arg, {})
+            rule = api_config.get("ratelimit")
+            if rule is False:
+                return None
+            if isinstance(rule, dict):
+                return arg, rule
+            if isinstance(rule, str):
+                tier = rule
+            else:
+                tier = "heavy" if api_config.get("return_type") in ("img", "video") else "light"
+        elif action == "test_image":
+            tier = "heavy"
+        else:
+            tier = "light"
+        return tier, self.ratelimit_config.get(tier, {})
+    
+    async def _check_rate_limit(self, bot: WechatAPIClient, message: dict, action: str, arg) -> bool:
+        """按发送者和聊天的令牌桶检查是否放行
+        
+        所有相关的桶都有令牌时才一起扣除，被某个桶拒绝不会消耗其他桶的令牌。
+        被限流时在notice_interval内只提示一次，之后的消息静默忽略。管理员不限流。
+        
+        Args:
+            bot: 机器人实例
+            message: 消息字典
+            action: 分发表动作
+            arg: 动作参数
+            
+        Returns:
+            是否放行
+        """
+        if not self.ratelimit_config.get("enable", True) or self._is_admin_message(message):
+            return True
+        rules = self._rate_limit_rules(action, arg, message)
+        if rules is None:
             return True
+        budget, scopes = rules
+        
+        from_wxid = message.get("FromWxid", "")
+        sender_wxid = message.get("SenderWxid", "") or from_wxid
+        owners = {"user": sender_wxid}
+        if message.get("IsGroup", False):
+            owners["chat"] = from_wxid
+        
+        buckets = []
+        for scope, owner in owners.items():
+            rule = scopes.get(scope)
+            if not rule:
+                continue
+            key = (scope, owner, budget)
+            bucket = self._rate_buckets.get(key)
+            if bucket is None or (bucket.rate, bucket.burst) != (rule.get("rate", 1), rule.get("burst", 1)):
+                bucket = TokenBucket(rule.get("rate", 1), rule.get("burst", 1))
+                self._rate_buckets.put(key, bucket)
+            buckets.append(bucket)
+        
+        if all(bucket.available() for bucket in buckets):
+            for bucket in buckets:
+                bucket.take()
+            return True
+        
+        wait = max(bucket.retry_after() for bucket in buckets)
+        logger.info(f"限流: {sender_wxid}@{from_wxid} {budget}，{wait:.0f}秒后恢复")
+        notice_key = (from_wxid, sender_wxid)
+        if self._throttle_notices.get(notice_key) is None:
+            self._throttle_notices.put(notice_key, True)
+            await self._send_text(bot, from_wxid, f"⏳ 操作太频繁，请{max(1, math.ceil(wait))}秒后再试")
+        return False
+    
+    def _session_key(self, message: dict, kind: str) -> tuple:
+        """生成搜索会话的键
+        
+        Args:
+            message: 消息字典
+            kind: 会话类型，drama或novel
+            
+        Returns:
+            (聊天wxid, 发送者wxid, 会话类型)
+        """
+        from_wxid = message.get("FromWxid", "")
+        sender_wxid = message.get("SenderWxid", "") or from_wxid
+        return (from_wxid, sender_wxid, kind)
+    
+    def _format_search_item(self, kind: str, index: int, item) -> str:
+        """格式化搜索结果中的一条
+        
+        Args:
+            kind: 会话类型，drama或novel
+            index: 全局序号，从1开始
+            item: 上游返回的结果条目
+            
+        Returns:
+            该条目的展示文本
+        """
+        if kind == "drama":
+            return (f"{index}. {item.get('title', '未知')}\n"
+                    f"   主演：{item.get('author', '未知')}\n"
+                    f"   类型：{item.get('type', '未知')}\n"
+                    f"   简介：{item.get('intro', '未知')}\n"
+                    f"   链接：{item.get('link', '未知')}\n\n")
+        
+        # 同一次搜索的结果结构相同，字段路径按结构只查找一次
+        fields = self._novel_fields.extract(item)
+        text = f"{index}. {fields['title']}\n"
+        if fields["author"]:
+            text += f"   作者：{fields['author']}\n"
+        novel_type = fields["type"]
+        if novel_type:
+            if isinstance(novel_type, list):
+                novel_type = "、".join(novel_type)
+            text += f"   类型：{novel_type}\n"
+        return text + "\n"
+    
+    def _render_search_page(self, kind: str, session: dict) -> str:
+        """从会话游标处渲染一页结果并推进游标
+        
+        每页在page_bytes的UTF-8字节预算内尽量多放条目，同时不超过该类型的每页条数上限；
+        单条超出预算时截断该条，保证每页至少前进一条。
+        
+        Args:
+            kind: 会话类型，drama或novel
+            session: 搜索会话
+            
+        Returns:
+            本页回复文本
+        """
+        results = session["results"]
+        start = session["cursor"]
+        label, icon = ("短剧", "📺") if kind == "drama" else ("小说", "📚")
+        page_bytes = self.session_config.get("page_bytes", 2000)
+        max_items = self.session_config.get(f"{kind}_page_items", 5 if kind == "drama" else 15)
+        
+        header = f"{icon} 搜索关键词：{session['keyword']}\n"
+        if start == 0:
+            total = f"{len(results)}" if session["exhausted"] else f"{len(results)}+"
+            header += f"找到 {total} 部相关{label}：\n\n"
+        else:
+            header += f"第 {start + 1} 部起的{label}：\n\n"
+        more_hint = "发送\"下一页\"可查看更多结果"
+        select_hint = "请回复数字序号查看小说详情" if kind == "novel" else ""
+        
+        # 预留页眉和最长页脚的字节数
+        used = len(header.encode()) + len(more_hint.encode()) + len(select_hint.encode()) + 1
+        body = []
+        index = start
+        while index < len(results) and len(body) < max_items:
+            entry = self._format_search_item(kind, index + 1, results[index])
+            size = len(entry.encode())
+            if used + size > page_bytes:
+                if body:
+                    break
+                entry = entry.encode()[:max(page_bytes - used, 0)].decode(errors="ignore") + "…\n\n"
+                size = len(entry.encode())
+            body.append(entry)
+            used += size
+            index += 1
+        session["cursor"] = index
+        
+        footer = []
+        if index < len(results) or not session["exhausted"]:
+            footer.append(more_hint)
+        if select_hint:
+            footer.append(select_hint)
+        return header + "".join(body) + "\n".join(footer)
+    
+    async def _search_upstream(self, bot: WechatAPIClient, to_wxid: str, kind: str, keyword: str, page: int = None):
+        """调用短剧/小说搜索接口
+        
+        Args:
+            bot: 机器人实例
+            to_wxid: 接收错误提示的wxid
+            kind: 会话类型，drama或novel
+            keyword: 搜索关键词
+            page: 上游页码，仅在API配置了page_param时传递
+            
+        Returns:
+            结果列表，接口出错或返回格式异常时返回None
+        """
+        cmd = "短剧" if kind == "drama" else "小说"
+        api_config = self.api_configs.get(cmd)
+        if not api_config:
+            return None
+        
+        # 设置搜索参数
+        api_config_copy = api_config.copy()  # 创建副本以避免修改原始配置
+        params = {"name": keyword} if kind == "drama" else {"name": keyword, "type": "json"}
+        page_param = api_config.get("page_param")
+        if page_param and page is not None:
+            params[page_param] = str(page)
+        api_config_copy["params"] = params
+        
+        result = await self._call_api(bot, to_wxid, cmd, api_config_copy)
+        if kind == "drama":
+            if isinstance(result, dict) and result.get("code") == 200 and "data" in result:
+                return result["data"] or []
+            return None
+        if isinstance(result, list):
+            return result
+        return [] if not result else None
+    
+    async def _open_search_session(self, bot: WechatAPIClient, message: dict, kind: str, keyword: str, results: list):
+        """保存新的搜索会话并发送第一页
+        
+        API配置了page_param时，会话只保存已取回的上游页，翻到末尾再按需拉取下一页。
+        """
+        api_config = self.api_configs.get("短剧" if kind == "drama" else "小说", {})
+        session = {
+            "keyword": keyword,
+            "results": list(results),
+            "cursor": 0,
+            "page": api_config.get("page_start", 1),
+            "page_starts": [0],
+            "exhausted": not api_config.get("page_param"),
+            "lock": asyncio.Lock(),
+            "details": {}
+        }
+        reply = self._render_search_page(kind, session)
+        key = self._session_key(message, kind)
+        previous = self._search_sessions.peek(key)
+        if previous is not None and previous.get("holder") is not None:
+            previous["holder"].cancel()
+        self._search_sessions.put(key, session)
+        self._search_sessions.put(self._session_key(message, "last"), kind)
+        await self._send_text(bot, message["FromWxid"], reply)
+        
+        # 回复发出后在后台预取前几部小说的详情和封面
+        if kind == "novel":
+            session["holder"] = self._spawn(self._hold_novel_session(key, session))
+    
+    async def _hold_novel_session(self, key: tuple, session: dict):
+        """预取前detail_prefetch部小说的详情，并在会话存续期间持有预取结果
+        
+        会话过期、被淘汰或被新的搜索替换后，取消未完成的预取并释放封面。
+        
+        Args:
+            key: 会话键
+            session: 小说搜索会话
+        """
+        count = min(self.session_config.get("detail_prefetch", 5), len(session["results"]))
+        for index in range(1, count + 1):
+            self._novel_detail_task(session, index, background=True)
+        
+        interval = min(self.session_config.get("ttl", 600), 30)
+        try:
+            while self._search_sessions.peek(key) is session:
+                await asyncio.sleep(interval)
+        finally:
+            details, session["details"] = session["details"], {}
+            for task in details.values():
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled() and task.result() and task.result()[1] is not None:
+                    self._release_response(task.result()[1])
+    
+    def _novel_detail_task(self, session: dict, index: int, background: bool = False) -> asyncio.Task:
+        """获取第index部小说详情的任务，已有进行中或成功的任务时直接复用
+        
+        Args:
+            session: 小说搜索会话
+            index: 全局序号，从1开始
+            background: 是否为后台预取，预取受detail_concurrency全局并发上限约束
+            
+        Returns:
+            结果为(字段, 封面响应或None)的任务，失败时结果为None
+        """
+        task = session["details"].get(index)
+        if task is None or task.cancelled() or (task.done() and task.result() is None):
+            task = self._spawn(self._fetch_novel_detail(session, index, background))
+            session["details"][index] = task
+        return task
+    
+    async def _fetch_novel_detail(self, session: dict, index: int, background: bool = False):
+        """请求小说详情并下载封面，封面由会话持有
+        
+        详情请求经过响应缓存和请求合并。
+        
+        Args:
+            session: 小说搜索会话
+            index: 全局序号，从1开始
+            background: 是否为后台预取
+            
+        Returns:
+            (字段, 封面响应或None)，接口出错或返回格式异常时返回None
+        """
+        if background:
+            if self._detail_semaphore is None:
+                self._detail_semaphore = asyncio.Semaphore(self.session_config.get("detail_concurrency", 2))
+            async with self._detail_semaphore:
+                return await self._fetch_novel_detail(session, index)
+        
+        api_config = self.api_configs.get("小说")
+        if not api_config:
+            return None
+        
+        # 设置详情参数；上游分页时序号换算为所在页和页内序号
+        api_config_copy = api_config.copy()
+        page_offset = bisect.bisect_right(session["page_starts"], index - 1) - 1
+        api_config_copy["params"] = {
+            "name": session["keyword"],
+            "n": str(index - session["page_starts"][page_offset]), 
+            "type": "json"
+        }
+        if api_config.get("page_param"):
+            api_config_copy["params"][api_config["page_param"]] = str(api_config.get("page_start", 1) + page_offset)
+        
+        try:
+            response = await self._fetch("小说", api_config_copy)
+            try:
+                if response.status != 200:
+                    logger.warning(f"获取小说详情响应状态码异常: {response.status}")
+                    return None
+                result = await self._decode_json(response)
+            finally:
+                self._release_response(response)
+        except Exception as e:
+            logger.error(f"获取小说详情失败: {str(e)}")
+            return None
+        
+        # 记录返回结构以便调试
+        logger.info(f"小说详情返回数据结构: {result}")
+        if not isinstance(result, dict):
+            logger.warning(f"获取小说详情返回数据异常: {result}")
+            return None
+        
+        fields = self._novel_fields.extract(result)
+        cover = None
+        novel_img = fields["img"]
+        if isinstance(novel_img, str) and novel_img.startswith("http"):
+            try:
+                cover_response = await self._download_media(novel_img, api_config)
+                try:
+                    if cover_response.status == 200:
+                        cover = await self._normalize_media(cover_response, "img", api_config)
+                finally:
+                    self._release_response(cover_response)
+            except Exception as img_e:
+                logger.error(f"获取小说封面图片失败: {str(img_e)}")
+        return fields, cover
+    
+    async def _handle_next_page(self, bot: WechatAPIClient, message: dict, kind: str = None):
+        """将搜索会话的游标推进一页
+        
+        Args:
+            bot: 机器人实例
+            message: 消息字典
+            kind: 会话类型，为None时使用该用户最近一次搜索的类型
+        """
+        from_wxid = message.get("FromWxid", "")
+        kind = kind or self._search_sessions.get(self._session_key(message, "last"))
+        session = self._search_sessions.get(self._session_key(message, kind)) if kind else None
+        if not session:
+            await self._send_text(bot, from_wxid, "没有可显示的剩余结果，请先进行搜索")
+            return
+        
+        # 同一会话的翻页串行执行，避免并发的"下一页"重复拉取同一上游页
+        async with session["lock"]:
+            results = session["results"]
+            if session["cursor"] >= len(results) and not session["exhausted"]:
+                try:
+                    more = await self._search_upstream(bot, from_wxid, kind, session["keyword"], session["page"] + 1)
+                except Exception as e:
+                    logger.error(f"获取下一页搜索结果失败: {str(e)}")
+                    more = None
+                if more is None:
+                    await self._send_text(bot, from_wxid, "获取下一页失败，请稍后重试")
+                    return
+                if more:
+                    session["page"] += 1
+                    session["page_starts"].append(len(results))
+                    results.extend(more)
+                else:
+                    session["exhausted"] = True
+            
+            if session["cursor"] >= len(results):
+                await self._send_text(bot, from_wxid, "没有更多结果了")
+                return
+            
+            reply = self._render_search_page(kind, session)
+            # 重新写入以刷新会话有效期
+            self._search_sessions.put(self._session_key(message, kind), session)
+            self._search_sessions.put(self._session_key(message, "last"), kind)
+        await self._send_text(bot, from_wxid, reply)
+    
+    async def _get_user_info(self, message: dict) -> tuple:
+        """获取用户信息"""
+        user_id = message.get("SenderId") or message.get("FromWxid", "")
+        # 尝试获取用户昵称
+        user_name = message.get("SenderNickname") or message.get("FromName", "未知用户")
+        
+        return user_id, user_name
+    
+    def _is_admin_message(self, message: dict) -> bool:
+        """消息发送者是否是管理员，用户ID的取法与_get_user_info一致"""
+        return self.is_admin(message.get("SenderId") or message.get("FromWxid", ""))
+        
+    def is_admin(self, user_id: str) -> bool:
+        """检查用户是否是管理员"""
+        # 这里可以根据项目的管理员判断逻辑进行调整
+        # 简单起见，先使用一个简单的判断
+        try:
+            from utils.admin import is_admin
+            return is_admin(user_id)
+        except ImportError:
+            # 如果没有专门的管理员判断函数，使用简单的判断方式
+            # 这里是假设的管理员ID列表，实际项目中应该从配置或数据库获取
+            admin_ids = ["wxid_abcdefg", "wxid_12345678"]
+            return user_id in admin_ids
+            
+    async def _get_test_image(self) -> tuple:
+        """获取测试图片，首次使用时在进程池中生成，之后复用
+        
+        Returns:
+            (图片路径, 图片数据, 本次是否使用了缓存)
+        """
+        if self._test_image is not None and os.path.exists(self._test_image[0]):
+            return (*self._test_image, True)
+        
+        temp_dir = os.path.join(os.path.dirname(__file__), "temp")
+        os.makedirs(temp_dir, exist_ok=True)
+        test_img_path = os.path.join(temp_dir, "test_image.jpg")
+        bg_color = (random.randint(0, 255), random.randint(0, 255), random.randint(0, 255))
+        await self._offload(_render_test_image, "APIInterface 测试图片", bg_color, test_img_path, process=True)
+        img_bytes = await self._offload(Path(test_img_path).read_bytes)
+        self._test_image = (test_img_path, img_bytes)
+        return (test_img_path, img_bytes, False)
+    
+    async def _send_test_image(self, bot: WechatAPIClient, to_wxid: str):
+        """发送测试图片，验证图片发送功能是否正常，并报告发送耗时
+        
+        直接调用客户端而不经过出站队列，测得的是客户端实际完成发送的时间。
+        """
+        try:
+            test_img_path, img_bytes, _ = await self._get_test_image()
+        except Exception as e:
+            logger.error(f"生成测试图片失败: {e}")
+            await self._send_text(bot, to_wxid, f"❌ 生成测试图片失败: {str(e)}")
+            return
+        
+        try:
+            logger.info(f"发送测试图片: {test_img_path}")
+            started = time.monotonic()
+            client_img_id, create_time, new_msg_id = await bot.send_image_message(to_wxid, Path(test_img_path))
+            elapsed = time.monotonic() - started
+            logger.info(f"测试图片发送结果: ClientImgId: {client_img_id}, MsgId: {new_msg_id}")
+            await self._send_text(bot, to_wxid, f"✅ 测试图片发送成功，耗时 {elapsed * 1000:.0f}ms\nClientImgId: {client_img_id}\nMsgId: {new_msg_id}")
+        except Exception as e:
+            logger.error(f"测试图片发送失败: {e}")
+            
+            # 尝试使用字节方式发送
+            try:
+                started = time.monotonic()
+                retry_result = await bot.send_image_message(to_wxid, img_bytes)
+                elapsed = time.monotonic() - started
+                logger.info(f"使用字节数据重试发送测试图片: {retry_result}")
+                await self._send_text(bot, to_wxid, f"⚠️ 按路径发送失败: {str(e)}\n✅ 字节方式发送成功，耗时 {elapsed * 1000:.0f}ms")
+            except Exception as retry_e:
+                logger.error(f"重试发送测试图片失败: {retry_e}")
+                await self._send_text(bot, to_wxid, f"❌ 测试图片发送失败: {str(e)}\n❌ 字节方式也失败: {str(retry_e)}")
+    
+    async def _run_diagnostics(self, bot: WechatAPIClient, message: dict):
+        """发送链路诊断：分别测量测试图片生成、三种发送方式和各API的上游往返耗时，汇总为一条报告"""
+        from_wxid = message.get("FromWxid", "")
+        user_id, user_name = await self._get_user_info(message)
+        
+        # 检查权限
+        if not self.is_admin(user_id):
+            await self._send_text(bot, from_wxid, "⚠️ 权限不足，只有管理员可以运行诊断")
+            return
+        
+        # 上游探测与发送测试同时进行，互不影响计时
+        probes = asyncio.gather(*(self._probe_upstream(api_config) for api_config in self.api_configs.values()))
+        
+        reply = "🩺 发送链路诊断\n"
+        started = time.monotonic()
+        try:
+            test_img_path, img_bytes, cached = await self._get_test_image()
+        except Exception as e:
+            probes.cancel()
+            await self._send_text(bot, from_wxid, f"❌ 生成测试图片失败: {str(e)}")
+            return
+        reply += f"🎨 生成图片: {(time.monotonic() - started) * 1000:.1f}ms{'（缓存）' if cached else ''}，{len(img_bytes)} 字节\n"
+        
+        # 三种发送方式依次进行，分别计时
+        for label in ("字节", "路径", "base64"):
+            started = time.monotonic()
+            try:
+                if label == "字节":
+                    payload = img_bytes
+                elif label == "路径":
+                    # 与出站队列发送落盘媒体时一致，传Path对象；str会被客户端当作base64字符串
+                    payload = Path(test_img_path)
+                else:
+                    payload = await self._offload(_b64encode_text, memoryview(img_bytes), size=len(img_bytes))
+                encoded = time.monotonic()
+                await bot.send_image_message(from_wxid, payload)
+                sent = time.monotonic()
+                reply += f"📤 {label}发送: {(sent - encoded) * 1000:.0f}ms"
+                reply += f"（编码 {(encoded - started) * 1000:.1f}ms）\n" if label == "base64" else "\n"
+            except Exception as e:
+                reply += f"📤 {label}发送: ❌ {str(e) or type(e).__name__}\n"
+        
+        reply += "🌐 上游往返（至响应头）:\n"
+        for cmd, result in zip(self.api_configs, await probes):
+            reply += f"  - {cmd}: {result}\n"
+        
+        await self._send_text(bot, from_wxid, reply.rstrip())
+    
+    async def _probe_upstream(self, api_config: Dict[str, Any]) -> str:
+        """测量一次上游往返耗时，只等到响应头，不读取响应体，也不计入熔断统计
+        
+        Args:
+            api_config: API配置
+            
+        Returns:
+            状态码和耗时的描述
+        """
+        url = api_config.get("url")
+        timeout = aiohttp.ClientTimeout(total=api_config.get("timeout", self.http_config.get("timeout", 15)))
+        try:
+            session = await self._get_session()
+            async with self._host_slot(url):
+                started = time.monotonic()
+                async with session.get(url, params=api_config.get("params", {}), timeout=timeout) as response:
+                    return f"{response.status}，{(time.monotonic() - started) * 1000:.0f}ms"
+        except asyncio.TimeoutError:
+            return "❌ 超时"
+        except Exception as e:
+            return f"❌ {str(e) or type(e).__name__}"
+
+    async def _call_api(self, bot: WechatAPIClient, to_wxid: str, cmd: str, api_config: Dict[str, Any]):
+        """调用API并把结果发送给用户，记录整个调用的耗时"""
+        started = time.monotonic()
+        try:
+            return await self._invoke_api(bot, to_wxid, cmd, api_config)
+        finally:
+            self._observe("apiinterface_api_duration_seconds", (("api", cmd),), time.monotonic() - started)
+    
+    async def _invoke_api(self, bot: WechatAPIClient, to_wxid: str, cmd: str, api_config: Dict[str, Any]):
+        """调用API接口并处理结果"""
+        response = None
+        try:
+            url = api_config.get("url")
+            method = api_config.get("method", "get").lower()
+            return_type = api_config.get("return_type", "text").lower()
+            params = api_config.get("params", {})
+            send_type = api_config.get("send_type", "bytes").lower()  # 默认使用字节方式
+            
+            logger.info(f"调用API: {url}, 方法: {method}, 返回类型: {return_type}, 发送方式: {send_type}, 参数: {params}")
+            
+            if method != "get":
+                logger.error(f"不支持的请求方法: {method}")
+                await self._send_text(bot, to_wxid, f"⚠️ 不支持的请求方法: {method}")
+                return
+            
+            # 随机媒体命令优先使用后台预取好的结果（只对原始配置生效，带自定义参数的副本不走预取）
+            if api_config is self.api_configs.get(cmd):
+                prefetched = self._take_prefetched(cmd)
+                if prefetched is not None:
+                    media_type, media_response = prefetched
+                    try:
+                        await self._send_media(bot, to_wxid, media_type, media_response, send_type)
+                    finally:
+                        self._release_response(media_response)
+                    return
+            
+            # 经过缓存层获取上游响应
+            response = await self._fetch(cmd, api_config)
+            if response.status != 200:
+                logger.warning(f"API响应状态码异常: {response.status}")
+                await self._send_text(bot, to_wxid, f"⚠️ API响应异常: {response.status}")
+                return
+                
+            if return_type in ("img", "video"):
+                media_label = "图片" if return_type == "img" else "视频"
+                
+                # 识别媒体格式，拒绝错误页面等非媒体数据，过大的图片先压缩
+                media_response = await self._normalize_media(response, return_type, api_config)
+                if media_response is None:
+                    await self._send_text(bot, to_wxid, f"⚠️ API返回的{media_label}数据无效")
+                    return
+                try:
+                    await self._send_media(bot, to_wxid, return_type, media_response, send_type)
+                finally:
+                    self._release_response(media_response)
+            elif return_type == "json":
+                # 处理JSON返回
+                try:
+                    json_data = await self._decode_json(response)
+                except Exception as extract_e:
+                    logger.error(f"解析JSON失败: {extract_e}")
+                    await self._send_text(bot, to_wxid, f"⚠️ API返回数据格式错误: {str(extract_e)}")
+                    return
+                
+                logger.info(f"API返回JSON数据: {json_data}")
+                
+                # 处理星座运势数据
+                if cmd == "星座" and isinstance(json_data, dict):
+                    if json_data.get("code") == 200 and "data" in json_data:
+                        await self._send_text(bot, to_wxid, _format_horoscope(json_data["data"]))
+                        return
+                
+                # 处理短剧搜索数据
+                if cmd == "短剧" and isinstance(json_data, dict):
+                    if json_data.get("code") == 200 and "data" in json_data:
+                        return json_data  # 返回完整的JSON数据，让_handle_drama处理
+                
+                # 检查JSON数据中是否包含视频URL
+                if isinstance(json_data, dict):
+                    video_url = self._extract_video_url(json_data)
+                    if video_url:
+                        logger.info(f"从JSON中获取到视频URL: {video_url}")
+                        
+                        # 下载视频
+                        video_response = await self._download_media(video_url, api_config)
+                        try:
+                            if video_response.status == 200:
+                                media_response = await self._normalize_media(video_response, "video", api_config)
+                                if media_response is None:
+                                    await self._send_text(bot, to_wxid, "⚠️ API返回的视频数据无效")
+                                    return
+                                try:
+                                    await self._send_media(bot, to_wxid, "video", media_response, send_type)
+                                finally:
+                                    self._release_response(media_response)
+                            else:
+                                logger.error(f"下载视频失败，状态码: {video_response.status}")
+                                await self._send_text(bot, to_wxid, f"⚠️ 下载视频失败: {video_response.status}")
+                        finally:
+                            self._release_response(video_response)
+                    else:
+                        # 如果不是视频URL，直接返回JSON数据
+                        return json_data
+                else:
+                    # 如果不是字典类型，直接返回数据
+                    return json_data
+            else:
+                # 处理文本返回
+                text = await self._offload(response.text, size=self._body_size(response.body))
+                await self._send_text(bot, to_wxid, text)
+                logger.info(f"已发送文本: {text[:100]}...")
+        except ResponseTooLargeError as size_err:
+            logger.warning(f"响应体过大: {size_err}")
+            await self._send_text(bot, to_wxid, "⚠️ 媒体文件过大，已放弃下载" if return_type in ("img", "video") else "⚠️ API返回数据过大，已放弃解析")
+        except CircuitOpenError as open_err:
+            logger.warning(f"上游熔断中，快速失败 [{cmd}]: {open_err}")
+            await self._send_text(bot, to_wxid, f"⚠️ {cmd}接口暂时不可用，请{max(1, round(open_err.retry_after))}秒后再试")
+        except aiohttp.ClientError as http_err:
+            logger.error(f"HTTP请求错误: {http_err}")
+            await self._send_text(bot, to_wxid, f"⚠️ API请求失败: {str(http_err)}")
+        except asyncio.TimeoutError:
+            logger.error("API请求超时")
+            await self._send_text(bot, to_wxid, f"⚠️ API请求超时，请稍后重试")
+        except Exception as e:
+            logger.error(f"调用API失败: {str(e)}")
+            await self._send_text(bot, to_wxid, f"⚠️ 调用API失败: {str(e)}")
+        finally:
+            if response is not None:
+                self._release_response(response)
+
+    def _prefetch_size(self, cmd: str) -> int:
+        """获取API配置的预取缓冲大小，未配置时为0"""
+        api_config = self.api_configs.get(cmd) or {}
+        return int(api_config.get("prefetch", 0))
+    
+    def _take_prefetched(self, cmd: str):
+        """从预取缓冲中取出一个可直接发送的结果，并触发后台补充
+        
+        Args:
+            cmd: API命令名
+            
+        Returns:
+            (媒体类型, 响应)，缓冲为空或未启用预取时返回None
+        """
+        if self._prefetch_size(cmd) <= 0:
+            return None
+        
+        pool = self._prefetch_pools.get(cmd)
+        item = pool.popleft() if pool else None
+        if item is not None:
+            self._prefetch_stats[cmd] = self._prefetch_stats.get(cmd, 0) + 1
+        self._ensure_prefetch(cmd)
+        return item
+    
+    def _ensure_prefetch(self, cmd: str):
+        """缓冲未满且没有正在进行的补充任务时，启动后台补充"""
+        if self._prefetch_size(cmd) <= 0 or cmd in self._prefetch_tasks:
+            return
+        # 上游失败后等待一段时间再重试，期间缓冲中剩余的结果照常使用
+        if time.monotonic() < self._prefetch_retry_at.get(cmd, 0):
+            return
+        self._prefetch_tasks[cmd] = self._spawn(self._refill_prefetch_pool(cmd))
+    
+    async def _refill_prefetch_pool(self, cmd: str):
+        """持续获取结果直到预取缓冲填满，上游出错时停止并推迟下次补充"""
+        try:
+            while True:
+                pool = self._prefetch_pools.setdefault(cmd, deque())
+                api_config = self.api_configs.get(cmd)
+                if api_config is None or len(pool) >= self._prefetch_size(cmd):
+                    return
+                
+                try:
+                    item = await self._prefetch_one(api_config)
+                except Exception as e:
+                    item = None
+                    logger.warning(f"预取失败 [{cmd}]: {str(e)}")
+                
+                if item is None:
+                    self._prefetch_retry_at[cmd] = time.monotonic() + self.http_config.get("prefetch_retry_delay", 30)
+                    return
+                pool.append(item)
+        finally:
+            self._prefetch_tasks.pop(cmd, None)
+    
+    async def _prefetch_one(self, api_config: Dict[str, Any]):
+        """获取一个可直接发送的媒体结果
+        
+        直接请求上游，不经过响应缓存和请求合并，保证每个预取结果都是独立的随机内容。
+        JSON接口会继续下载其中的视频地址。
+        
+        Args:
+            api_config: API配置
+            
+        Returns:
+            (媒体类型, 响应)，上游返回无效数据时返回None
+        """
+        return_type = api_config.get("return_type", "text").lower()
+        response = await self._request(api_config)
+        
+        if return_type in ("img", "video"):
+            try:
+                if response.status != 200:
+                    return None
+                media_response = await self._normalize_media(response, return_type, api_config)
+            finally:
+                self._release_response(response)
+            return (return_type, media_response) if media_response else None
+        
+        try:
+            if return_type != "json" or response.status != 200:
+                return None
+            json_data = await self._decode_json(response)
+        finally:
+            self._release_response(response)
+        
+        video_url = self._extract_video_url(json_data) if isinstance(json_data, dict) else None
+        if not video_url:
+            return None
+        video_response = await self._download_media(video_url, api_config)
+        try:
+            if video_response.status != 200:
+                return None
+            media_response = await self._normalize_media(video_response, "video", api_config)
+        finally:
+            self._release_response(video_response)
+        return ("video", media_response) if media_response else None
+    
+    def _clear_prefetch_pools(self):
+        """清空所有预取缓冲并删除落盘的数据"""
+        for pool in self._prefetch_pools.values():
+            while pool:
+                _, response = pool.popleft()
+                self._release_response(response)
+        self._prefetch_pools = {}
+    
+    def _extract_video_url(self, json_data: dict) -> str:
+        """尝试从不同路径获取JSON中的视频URL
+        
+        Args:
+            json_data: API返回的JSON对象
+            
+        Returns:
+            视频URL，不存在时返回None
+        """
+        if "data" in json_data and isinstance(json_data["data"], dict):
+            if "videourl" in json_data["data"]:
+                return json_data["data"]["videourl"]
+            elif "url" in json_data["data"]:
+                return json_data["data"]["url"]
+        elif "videourl" in json_data:
+            return json_data["videourl"]
+        elif "url" in json_data:
+            return json_data["url"]
+        return None
+    
+    async def _download_media(self, media_url: str, api_config: Dict[str, Any]) -> "ApiResponse":
+        """下载JSON中给出的媒体地址，大小限制沿用所属API的配置
+        
+        Args:
+            media_url: 媒体地址
+            api_config: 返回该地址的API配置
+            
+        Returns:
+            媒体响应，非200响应的body为空
+        """
+        async def download():
+            session = await self._get_session()
+            media_timeout = aiohttp.ClientTimeout(total=self.http_config.get("media_timeout", 120))
+            # 与API请求共用按主机的并发上限
+            async with self._host_slot(media_url):
+                async with session.get(media_url, timeout=media_timeout) as response:
+                    if response.status != 200:
+                        return ApiResponse(response.status, response.headers.copy(), b"")
+                    body = await self._read_body(response, api_config)
+                    return ApiResponse(response.status, response.headers.copy(), body)
+        
+        return await self._guarded(media_url, download())
+    
+    async def _decode_json(self, response: "ApiResponse"):
+        """解析JSON响应，直接解析失败时尝试从HTML中提取JSON
+        
+        安装了orjson时使用orjson；较大的响应体（包括落盘的响应体）的读取和解析交给线程池。
+        
+        Args:
+            response: 上游响应
+            
+        Returns:
+            解析后的JSON数据
+        """
+        size = self._body_size(response.body)
+        data = await self._offload(self._body_bytes, response, size=size)
+        try:
+            return await self._offload(_parse_json_body, data, size=size)
+        except ValueError:
+            logger.info(f"API返回原始数据: {data[:200].decode('utf-8', errors='replace')}...")  # 只记录前200个字节
+            raise
+    
+    def _body_bytes(self, response: "ApiResponse") -> bytes:
+        """读取响应体并转换为UTF-8编码的字节，供后台线程调用"""
+        data = response.body.read_bytes() if isinstance(response.body, Path) else response.body
+        charset = (response.charset or "utf-8").lower()
+        if charset not in ("utf-8", "utf8", "ascii", "us-ascii"):
+            data = data.decode(charset, errors="replace").encode("utf-8")
+        return data
+
+    async def _request(self, api_config: Dict[str, Any], headers: Dict[str, str] = None) -> "ApiResponse":
+        """向上游发起GET请求，配置了endpoints的API在一组等价端点之间负载均衡并自动故障转移
+        
+        端点选择使用“二选一”（power of two choices）：随机取两个端点，选EWMA耗时加错误率惩罚较低的一个；
+        熔断中的端点不参与选择。请求失败或返回5xx时换下一个端点，直到所有端点都试过。
+        
+        Args:
+            api_config: API配置
+            headers: 额外的请求头，例如条件请求头
+            
+        Returns:
+            与连接解耦的响应快照，非200响应的body为空
+        """
+        endpoints = api_config.get("endpoints")
+        if not endpoints:
+            return await self._request_endpoint(api_config, headers)
+        
+        candidates = [self._endpoint_config(api_config, endpoint) for endpoint in endpoints]
+        last_error = None
+        while candidates:
+            chosen = self._choose_endpoint(candidates)
+            candidates.remove(chosen)
+            url = chosen.get("url")
+            
+            started = time.monotonic()
+            try:
+                response = await self._request_endpoint(chosen, headers)
+            except CircuitOpenError as e:
+                last_error = e
+                continue
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self._get_endpoint_stats(url).record(time.monotonic() - started, True)
+                last_error = e
+                if candidates:
+                    logger.warning(f"端点请求失败，切换到下一个端点: {url}: {str(e) or type(e).__name__}")
+                continue
+            
+            failed = response.status >= 500
+            self._get_endpoint_stats(url).record(time.monotonic() - started, failed)
+            if failed and candidates:
+                logger.warning(f"端点响应{response.status}，切换到下一个端点: {url}")
+                self._release_response(response)
+                continue
+            return response
+        
+        raise last_error
+    
+    def _endpoint_config(self, api_config: Dict[str, Any], endpoint) -> Dict[str, Any]:
+        """把端点定义合并到API配置上，得到单个端点的请求配置
+        
+        Args:
+            api_config: API配置
+            endpoint: 端点地址字符串，或包含url/params等覆盖项的字典
+            
+        Returns:
+            单个端点的配置
+        """
+        if isinstance(endpoint, str):
+            endpoint = {"url": endpoint}
+        merged = {key: value for key, value in api_config.items() if key != "endpoints"}
+        merged.update(endpoint)
+        merged["params"] = {**api_config.get("params", {}), **endpoint.get("params", {})}
+        return merged
+    
+    def _choose_endpoint(self, candidates: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """用二选一策略从候选端点中选出一个"""
+        usable = []
+        for candidate in candidates:
+            breaker = self._get_breaker(candidate.get("url"))
+            if breaker is None or not breaker.is_open():
+                usable.append(candidate)
+        if not usable:
+            usable = candidates
+        if len(usable) == 1:
+            return usable[0]
+        
+        error_penalty = self.http_config.get("balance_error_penalty", 5)
+        first, second = random.sample(usable, 2)
+        first_score = self._get_endpoint_stats(first.get("url")).score(error_penalty)
+        second_score = self._get_endpoint_stats(second.get("url")).score(error_penalty)
+        return first if first_score <= second_score else second
+    
+    def _get_endpoint_stats(self, url: str) -> "EndpointStats":
+        """获取端点的EWMA统计"""
+        stats = self._endpoint_stats.get(url)
+        if stats is None:
+            stats = EndpointStats(self.http_config.get("balance_alpha", 0.3))
+            self._endpoint_stats[url] = stats
+        return stats
+    
+    async def _request_endpoint(self, api_config: Dict[str, Any], headers: Dict[str, str] = None) -> "ApiResponse":
+        """向单个端点发起GET请求，失败时按API的重试策略以带抖动的指数退避重试
+        
+        重试和对冲请求都要从上游的重试预算中扣除令牌，预算耗尽（例如上游整体故障）时不再重试，
+        避免重试放大上游负载；熔断打开时不重试。
+        
+        Args:
+            api_config: API配置
+            headers: 额外的请求头，例如条件请求头
+            
+        Returns:
+            与连接解耦的响应快照，非200响应的body为空
+            
+        Raises:
+            CircuitOpenError: 上游处于熔断状态
+        """
+        url = api_config.get("url")
+        policy = self._retry_policy(api_config)
+        budget = self._get_retry_budget(url)
+        budget.deposit()
+        
+        attempt = 0
+        while True:
+            try:
+                response = await self._hedged_request(api_config, headers, budget)
+            except CircuitOpenError:
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt >= policy["attempts"] or not budget.try_spend():
+                    raise
+                attempt += 1
+                delay = self._backoff_delay(policy, attempt)
+                logger.warning(f"上游请求失败，{delay:.2f}秒后第{attempt}次重试: {url}: {str(e) or type(e).__name__}")
+                await asyncio.sleep(delay)
+                continue
+            
+            if response.status in policy["statuses"] and attempt < policy["attempts"] and budget.try_spend():
+                self._release_response(response)
+                attempt += 1
+                delay = self._backoff_delay(policy, attempt)
+                logger.warning(f"上游响应{response.status}，{delay:.2f}秒后第{attempt}次重试: {url}")
+                await asyncio.sleep(delay)
+                continue
+            return response
+    
+    def _retry_policy(self, api_config: Dict[str, Any]) -> Dict[str, Any]:
+        """合并[retry]段默认值和API配置中的retry覆盖项"""
+        overrides = api_config.get("retry", {})
+        if not isinstance(overrides, dict):
+            overrides = {} if overrides else {"attempts": 0}
+        return {
+            "attempts": int(overrides.get("attempts", self.retry_config.get("attempts", 1))),
+            "backoff": overrides.get("backoff", self.retry_config.get("backoff", 0.3)),
+            "max_backoff": overrides.get("max_backoff", self.retry_config.get("max_backoff", 3)),
+            "statuses": set(overrides.get("retry_statuses", self.retry_config.get("retry_statuses", [502, 503, 504])))
+        }
+    
+    def _backoff_delay(self, policy: Dict[str, Any], attempt: int) -> float:
+        """计算第attempt次重试前的等待时间（指数退避 + 全抖动）"""
+        return random.uniform(0, min(policy["max_backoff"], policy["backoff"] * (2 ** (attempt - 1))))
+    
+    def _get_retry_budget(self, url: str) -> "RetryBudget":
+        """获取上游（与熔断器同一划分方式）的重试预算"""
+        key = self._breaker_key(url)
+        budget = self._retry_budgets.get(key)
+        if budget is None:
+            budget = RetryBudget(self.retry_config.get("budget_ratio", 0.2), self.retry_config.get("budget_max", 10))
+            self._retry_budgets[key] = budget
+        return budget
+    
+    async def _hedged_request(self, api_config: Dict[str, Any], headers: Dict[str, str], budget: "RetryBudget") -> "ApiResponse":
+        """发起请求，配置了hedge的API在首个请求超过观测到的p95耗时后再发一个对冲请求，先返回者胜出
+        
+        Args:
+            api_config: API配置
+            headers: 额外的请求头
+            budget: 上游的重试预算，对冲请求同样消耗预算
+            
+        Returns:
+            最先成功的响应
+        """
+        hedge_delay = self._hedge_delay(api_config)
+        if hedge_delay is None:
+            return await self._timed_request(api_config, headers)
+        
+        tasks = [asyncio.ensure_future(self._timed_request(api_config, headers))]
+        winner = None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+            if not done and budget.try_spend():
+                url = api_config.get("url")
+                logger.info(f"请求超过{hedge_delay:.2f}秒未返回，发出对冲请求: {url}")
+                self._hedge_stats[url] = self._hedge_stats.get(url, 0) + 1
+                tasks.append(asyncio.ensure_future(self._timed_request(api_config, headers)))
+            
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = task
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            # 取消落后的请求，已经完成但未被采用的响应要释放
+            for task in tasks:
+                if task is winner:
+                    continue
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled() and task.exception() is None:
+                    self._release_response(task.result())
+    
+    def _hedge_delay(self, api_config: Dict[str, Any]) -> float:
+        """对冲请求的触发时间：该API最近成功请求耗时的p95，样本不足或未启用对冲时返回None"""
+        if not api_config.get("hedge", False):
+            return None
+        window = self._latency_windows.get(api_config.get("url"))
+        if window is None or len(window) < self.retry_config.get("hedge_min_samples", 20):
+            return None
+        return max(self.retry_config.get("hedge_min_delay", 0.3), window.percentile(0.95))
+    
+    async def _timed_request(self, api_config: Dict[str, Any], headers: Dict[str, str] = None) -> "ApiResponse":
+        """在熔断器保护下请求一次上游，并记录成功请求的耗时"""
+        url = api_config.get("url")
+        started = time.monotonic()
+        response = await self._guarded(url, self._send_request(api_config, headers))
+        if response.status < 500:
+            window = self._latency_windows.get(url)
+            if window is None:
+                window = LatencyWindow()
+                self._latency_windows[url] = window
+            window.add(time.monotonic() - started)
+        return response
+    
+    async def _guarded(self, url: str, request):
+        """在熔断器保护下执行一次上游请求
+        
+        连接错误、超时和5xx响应计为失败；熔断打开时不发出请求，直接抛出CircuitOpenError。
+        
+        Args:
+            url: 请求地址，用于确定熔断器
+            request: 执行请求的协程，返回ApiResponse
+            
+        Returns:
+            请求协程的返回值
+        """
+        breaker = self._get_breaker(url)
+        if breaker is None:
+            return await request
+        if not breaker.allow():
+            request.close()
+            raise CircuitOpenError(self._breaker_key(url), breaker.retry_after())
+        
+        try:
+            response = await request
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            breaker.record_failure(str(e) or type(e).__name__)
+            raise
+        except BaseException:
+            breaker.release()
+            raise
+        
+        if response.status >= 500:
+            breaker.record_failure(f"HTTP {response.status}")
+        else:
+            breaker.record_success()
+        return response
+    
+    def _breaker_key(self, url: str) -> str:
+        """熔断器的键：按主机（默认）或按完整接口地址"""
+        if self.breaker_config.get("scope", "host") == "api":
+            return url.split("?", 1)[0]
+        return urllib.parse.urlsplit(url).hostname or url
+    
+    def _get_breaker(self, url: str) -> "CircuitBreaker":
+        """获取上游对应的熔断器，未启用熔断时返回None"""
+        if not url or not self.breaker_config.get("enabled", True):
+            return None
+        key = self._breaker_key(url)
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                self.breaker_config.get("failure_threshold", 5),
+                self.breaker_config.get("recovery_timeout", 30)
+            )
+            self._breakers[key] = breaker
+        return breaker
+    
+    async def _send_request(self, api_config: Dict[str, Any], headers: Dict[str, str] = None) -> "ApiResponse":
+        """向上游发起一次GET请求并读取完整响应"""
+        url = api_config.get("url")
+        params = api_config.get("params", {})
+        return_type = api_config.get("return_type", "text").lower()
+        
+        # 复用插件共享的连接池，并按主机限制并发
+        session = await self._get_session()
+        # 设置超时，可在API配置中单独覆盖
+        timeout = aiohttp.ClientTimeout(total=api_config.get("timeout", self.http_config.get("timeout", 15)))
+        labels = (("upstream", urllib.parse.urlsplit(url).hostname or ""),)
+        timings = {}
+        async with self._host_slot(url):
+            started = time.monotonic()
+            try:
+                async with session.get(url, params=params, headers=headers, timeout=timeout, trace_request_ctx=timings) as response:
+                    headers_at = time.monotonic()
+                    self._count("apiinterface_upstream_responses_total", labels + (("status", str(response.status)),))
+                    self._observe("apiinterface_upstream_ttfb_seconds", labels, headers_at - started)
+                    if "connect" in timings:
+                        self._observe("apiinterface_upstream_connect_seconds", labels, timings["connect"])
+                    if response.status != 200:
+                        return ApiResponse(response.status, response.headers.copy(), b"")
+                    
+                    # 只有图片/视频允许落盘，JSON和文本需要在内存中解析
+                    body = await self._read_body(response, api_config, spool=return_type in ("img", "video"))
+                    self._observe("apiinterface_upstream_body_seconds", labels, time.monotonic() - headers_at)
+                    self._count("apiinterface_upstream_bytes_total", labels, self._body_size(body))
+                    return ApiResponse(response.status, response.headers.copy(), body, response.charset)
+            except asyncio.TimeoutError:
+                self._count("apiinterface_upstream_timeouts_total", labels)
+                raise
+
+    def _cache_policy(self, api_config: Dict[str, Any]) -> Dict[str, float]:
+        """解析API的缓存策略
+        
+        API配置中cache = false表示不缓存（随机返回内容的接口），
+        cache = { ttl = ..., stale_while_revalidate = ..., stale_if_error = ... }覆盖[cache]段的默认值
+        
+        Args:
+            api_config: API配置
+            
+        Returns:
+            缓存策略字典，不缓存时返回None
+        """
+        policy = api_config.get("cache", {})
+        if policy is False or not self.cache_config.get("enabled", True):
+            return None
+        if not isinstance(policy, dict):
+            policy = {}
+        
+        ttl = policy.get("ttl", self.cache_config.get("default_ttl", 0))
+        if ttl <= 0:
+            return None
+        return {
+            "ttl": ttl,
+            "stale_while_revalidate": policy.get("stale_while_revalidate", self.cache_config.get("stale_while_revalidate", 0)),
+            "stale_if_error": policy.get("stale_if_error", self.cache_config.get("stale_if_error", 0))
+        }
+    
+    def _cache_key(self, api_config: Dict[str, Any]) -> str:
+        """根据URL和参数生成缓存键"""
+        params = api_config.get("params", {})
+        query = urllib.parse.urlencode(sorted((str(k), str(v)) for k, v in params.items()))
+        return f"{api_config.get('url')}?{query}"
+    
+    async def _fetch(self, cmd: str, api_config: Dict[str, Any]) -> "ApiResponse":
+        """获取上游响应，相同API、相同参数的并发请求合并为一次上游调用
+        
+        返回随机内容的接口在API配置中设置coalesce = false，每个请求单独调用上游。
+        
+        Args:
+            cmd: API命令名
+            api_config: API配置
+            
+        Returns:
+            上游响应或缓存的响应，使用完毕后需调用_release_response
+        """
+        if not api_config.get("coalesce", self.http_config.get("coalesce", True)):
+            return await self._fetch_cached(cmd, api_config)
+        
+        key = self._cache_key(api_config)
+        flight = self._inflight.get(key)
+        while flight is not None:
+            # 已有相同请求在进行中，等待其结果；发起者被取消时重新请求
+            flight.waiters += 1
+            self._coalesce_stats[cmd] = self._coalesce_stats.get(cmd, 0) + 1
+            try:
+                response = await asyncio.shield(flight.future)
+            except asyncio.CancelledError:
+                # 等待者被取消：结果未出时撤回名额，已出时归还发起者替它持有的引用
+                future = flight.future
+                if not future.done():
+                    flight.waiters -= 1
+                elif not future.cancelled() and future.exception() is None and future.result() is not InFlight.ABANDONED:
+                    self._release_response(future.result())
+                raise
+            if response is not InFlight.ABANDONED:
+                return response
+            flight = self._inflight.get(key)
+        
+        flight = InFlight()
+        self._inflight[key] = flight
+        try:
+            response = await self._fetch_cached(cmd, api_config)
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                # 发起者被取消（例如后台预取随会话结束），不能连带取消其他等待者
+                flight.future.set_result(InFlight.ABANDONED)
+            elif flight.waiters:
+                flight.future.set_exception(e)
+            else:
+                flight.future.cancel()
+            raise
+        else:
+            # 每个等待者各持有一份引用
+            response.refs += flight.waiters
+            flight.future.set_result(response)
+            return response
+        finally:
+            self._inflight.pop(key, None)
+    
+    def _release_response(self, response: "ApiResponse"):
+        """释放一份响应引用，最后一个持有者负责清理落盘的响应体"""
+        response.refs -= 1
+        if response.refs <= 0:
+            self._discard_body(response.body)
+    
+    async def _fetch_cached(self, cmd: str, api_config: Dict[str, Any]) -> "ApiResponse":
+        """获取上游响应，按API的缓存策略处理命中、过期重验证与出错降级
+        
+        Args:
+            cmd: API命令名，用于统计命中率
+            api_config: API配置
+            
+        Returns:
+            上游响应或缓存的响应
+        """
+        policy = self._cache_policy(api_config)
+        if policy is None:
+            return await self._request(api_config)
+        
+        key = self._cache_key(api_config)
+        stats = self._cache_stats.setdefault(cmd, {"hit": 0, "stale": 0, "miss": 0, "revalidated": 0, "stale_error": 0})
+        entry = self._response_cache.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry.stored_at
+            if age < policy["ttl"]:
+                stats["hit"] += 1
+                return entry.response.retain()
+            if age < policy["ttl"] + policy["stale_while_revalidate"]:
+                # 先返回过期数据，同时在后台刷新
+                stats["stale"] += 1
+                self._revalidate_in_background(cmd, key, api_config, policy, entry)
+                return entry.response.retain()
+        
+        stats["miss"] += 1
+        return await self._refresh_cache(cmd, key, api_config, policy, entry)
+    
+    async def _refresh_cache(self, cmd: str, key: str, api_config: Dict[str, Any], policy: Dict[str, float], entry: "CacheEntry") -> "ApiResponse":
+        """请求上游并更新缓存，已有缓存时使用ETag/Last-Modified发起条件请求
+        
+        Args:
+            cmd: API命令名
+            key: 缓存键
+            api_config: API配置
+            policy: 缓存策略
+            entry: 已有的缓存条目，可为None
+            
+        Returns:
+            最新响应；上游出错且缓存仍在stale_if_error期限内时返回缓存的响应
+        """
+        stats = self._cache_stats[cmd]
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        
+        def can_serve_stale() -> bool:
+            return entry is not None and time.monotonic() - entry.stored_at < policy["ttl"] + policy["stale_if_error"]
+        
+        try:
+            response = await self._request(api_config, headers)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if can_serve_stale():
+                stats["stale_error"] += 1
+                logger.warning(f"上游请求失败，返回缓存数据 [{cmd}]: {e}")
+                return entry.response.retain()
+            raise
+        
+        if response.status == 304 and entry is not None:
+            stats["revalidated"] += 1
+            entry.stored_at = time.monotonic()
+            return entry.response.retain()
+        
+        if response.status >= 500 and can_serve_stale():
+            stats["stale_error"] += 1
+            logger.warning(f"上游响应异常({response.status})，返回缓存数据 [{cmd}]")
+            return entry.response.retain()
+        
+        max_entry_bytes = self.cache_config.get("max_entry_bytes", 1024 * 1024)
+        if response.status == 200 and isinstance(response.body, bytes) and len(response.body) <= max_entry_bytes:
+            # 缓存自己持有一份引用（只缓存内存中的响应体，淘汰时无需清理）
+            self._response_cache.put(key, CacheEntry(response.retain()))
+        return response
+    
+    def _revalidate_in_background(self, cmd: str, key: str, api_config: Dict[str, Any], policy: Dict[str, float], entry: "CacheEntry"):
+        """在后台刷新过期的缓存条目，同一个键同时只刷新一次"""
+        if key in self._revalidating:
+            return
+        self._revalidating.add(key)
+        
+        async def revalidate():
+            try:
+                self._release_response(await self._refresh_cache(cmd, key, api_config, policy, entry))
+            except Exception as e:
+                logger.warning(f"后台刷新缓存失败 [{cmd}]: {e}")
+            finally:
+                self._revalidating.discard(key)
+        
+        self._spawn(revalidate())
+    
+    async def _offload(self, func, *args, size: int = None, process: bool = False):
+        """把CPU密集或阻塞的工作交给执行器，避免卡住事件循环
+        
+        输入小于threshold字节时切换线程的开销比工作本身还大，直接在事件循环中执行。
+        线程池与调用方共享内存，大块数据以memoryview传入即可避免复制；
+        进程池需要序列化参数，只适合输入小、计算重的工作（如绘图）。
+        
+        Args:
+            func: 要执行的函数，使用进程池时必须是模块级函数
+            *args: 函数参数
+            size: 输入数据的字节数，为None时总是交给执行器
+            process: 是否使用进程池
+            
+        Returns:
+            函数的返回值
+        """
+        if size is not None and size < self.offload_config.get("threshold", 262144):
+            return func(*args)
+        return await asyncio.get_running_loop().run_in_executor(self._get_executor(process), func, *args)
+    
+    def _get_executor(self, process: bool = False):
+        """获取共享的线程池或进程池，进程池不可用时退回线程池"""
+        if process and self.offload_config.get("processes", 1) > 0:
+            if self._process_pool is None:
+                try:
+                    self._process_pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.offload_config.get("processes", 1))
+                except (OSError, NotImplementedError) as e:
+                    logger.warning(f"创建进程池失败，改用线程池: {str(e)}")
+                    self.offload_config = {**self.offload_config, "processes": 0}
+            if self._process_pool is not None:
+                return self._process_pool
+        
+        if self._thread_pool is None:
+            self._thread_pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.offload_config.get("threads", 4), thread_name_prefix="APIInterface"
+            )
+        return self._thread_pool
+    
+    def _shutdown_executors(self):
+        """关闭线程池和进程池，不等待未完成的工作"""
+        for executor in (self._thread_pool, self._process_pool):
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+        self._thread_pool = None
+        self._process_pool = None
+    
+    def _observe(self, name: str, labels: tuple, seconds: float):
+        """记录一次耗时到对应的直方图"""
+        histogram = self._histograms.get((name, labels))
+        if histogram is None:
+            histogram = self._histograms[(name, labels)] = LatencyHistogram()
+        histogram.observe(seconds)
+    
+    def _count(self, name: str, labels: tuple, amount: float = 1):
+        """累加计数器"""
+        key = (name, labels)
+        self._counters[key] = self._counters.get(key, 0) + amount
+    
+    def _format_labels(self, labels: tuple) -> str:
+        """格式化为Prometheus标签"""
+        if not labels:
+            return ""
+        pairs = []
+        for key, value in labels:
+            value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            pairs.append(f'{key}="{value}"')
+        return "{" + ",".join(pairs) + "}"
+    
+    def _render_metrics(self) -> str:
+        """把当前指标渲染为Prometheus文本格式"""
+        counters = dict(self._counters)
+        for cmd, stats in self._cache_stats.items():
+            for result, value in stats.items():
+                counters[("apiinterface_cache_requests_total", (("api", cmd), ("result", result)))] = value
+        counters[("apiinterface_shed_total", ())] = self._shed_count
+        
+        lines = []
+        histograms = {}
+        for (name, labels), histogram in self._histograms.items():
+            histograms.setdefault(name, []).append((labels, histogram))
+        for name in sorted(histograms):
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in histograms[name]:
+                cumulative = 0
+                for bound, count in zip(LatencyHistogram.BOUNDS + ("+Inf",), histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{self._format_labels(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_sum{self._format_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{self._format_labels(labels)} {histogram.count}")
+        
+        grouped = {}
+        for (name, labels), value in counters.items():
+            grouped.setdefault(name, []).append((labels, value))
+        for name in sorted(grouped):
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in grouped[name]:
+                lines.append(f"{name}{self._format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+    
+    def _write_text_atomic(self, path: str, text: str):
+        """以临时文件+原子重命名的方式写入文本文件，供后台线程调用"""
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".metrics_", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(text)
+            # mkstemp创建的文件权限为0600，以其他用户运行的node_exporter需要能读取
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.unlink(temp_path)
+            raise
+    
+    async def _export_metrics_periodically(self):
+        """定期重写Prometheus指标文件，供node_exporter的textfile collector采集"""
+        while True:
+            await asyncio.sleep(self.metrics_config.get("interval", 15))
+            path = self.metrics_config.get("textfile")
+            if not path:
+                continue
+            try:
+                await self._offload(self._write_text_atomic, path, self._render_metrics())
+            except Exception as e:
+                logger.error(f"写入指标文件失败 {path}: {str(e)}")
+    
+    def _spawn(self, coro) -> asyncio.Task:
+        """创建由插件持有引用的后台任务，插件卸载时统一取消"""
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
+
+    async def _read_body(self, response: aiohttp.ClientResponse, api_config: Dict[str, Any], spool: bool = True) -> Union[bytes, Path]:
+        """流式读取响应体
+        
+        先根据Content-Length预判大小，读取过程中累计字节数超过上限立即中止；
+        超过落盘阈值的响应体写入临时文件，避免整段数据驻留内存。
+        
+        Args:
+            response: 状态码为200的响应对象
+            api_config: API配置，可通过max_bytes/spool_bytes/max_json_bytes覆盖全局设置
+            spool: 是否允许落盘，为False时始终返回bytes并以max_json_bytes为上限
             
-        # 直接处理短剧搜索请求，不需要前缀
-        if content.startswith("短剧"):
-            if content == "短剧":
-                await bot.send_text_message(from_wxid, "请指定搜索关键词，例如：短剧总裁")
-                return True  # 修改：允许其他插件处理
-                
-            params = content[2:].strip()
-            if params:
-                await self._handle_drama(bot, message, params)
-                return True  # 修改：允许其他插件处理
-                
-        # 显示剩余短剧结果
-        if content == "显示剩余" or content == "短剧显示剩余":
-            if hasattr(self, '_drama_cache') and self._drama_cache:
-                await self._handle_drama(bot, message, "显示剩余")
-            else:
-                await bot.send_text_message(from_wxid, "没有可显示的剩余结果，请先进行搜索")
-            return True  # 修改：允许其他插件处理
+        Returns:
+            小文件返回bytes，大文件返回临时文件路径（调用方负责_discard_body）
             
-        # 新增：处理小说搜索请求
-        if content.startswith("小说"):
-            if content == "小说":
-                await bot.send_text_message(from_wxid, "请指定搜索关键词，例如：小说总裁")
-                return True
-                
-            params = content[2:].strip()
-            if params:
-                await self._handle_novel(bot, message, params)
-                return True
-                
-        # 新增：处理小说序号选择
-        if content.isdigit() and hasattr(self, '_novel_cache') and self._novel_cache:
-            await self._handle_novel_selection(bot, message, int(content))
-            return True
+        Raises:
+            ResponseTooLargeError: 响应体超过max_bytes
+        """
+        if spool:
+            max_bytes = api_config.get("max_bytes", self.http_config.get("max_media_bytes", 50 * 1024 * 1024))
+            spool_bytes = api_config.get("spool_bytes", self.http_config.get("spool_bytes", 2 * 1024 * 1024))
+        else:
+            # JSON和文本需要整段解析，使用单独的、更小的上限
+            max_bytes = api_config.get("max_json_bytes", self.http_config.get("max_json_bytes", 2 * 1024 * 1024))
+            spool_bytes = max_bytes
         
-        # 处理管理命令，无需@机器人
-        if content.startswith("添加API "):
-            await self._add_api(bot, message)
-            return True  # 修改：允许其他插件处理
-        elif content.startswith("删除API "):
-            await self._remove_api(bot, message)
-            return True  # 修改：允许其他插件处理
-        elif content.startswith("API列表"):
-            await self._list_api(bot, message)
-            return True  # 修改：允许其他插件处理
+        if response.content_length is not None and response.content_length > max_bytes:
+            raise ResponseTooLargeError(f"Content-Length {response.content_length} 超过上限 {max_bytes}")
+        
+        buffer = bytearray()
+        spool_file = None
+        total = 0
+        try:
+            async for chunk in response.content.iter_chunked(64 * 1024):
+                total += len(chunk)
+                if total > max_bytes:
+                    raise ResponseTooLargeError(f"已读取 {total} 字节，超过上限 {max_bytes}")
                 
-        # 检查是否是API调用指令
-        for cmd, api_config in self.api_configs.items():
-            if content == cmd:
-                logger.info(f"收到API调用指令: {cmd}")
-                await self._call_api(bot, from_wxid, cmd, api_config)
-                return True  # 修改：允许其他插件处理
+                if spool_file is None and total > spool_bytes:
+                    # 超过落盘阈值，把已缓存的数据转存到临时文件
+                    temp_dir = os.path.join(os.path.dirname(__file__), "temp")
+                    os.makedirs(temp_dir, exist_ok=True)
+                    spool_file = tempfile.NamedTemporaryFile(dir=temp_dir, prefix="media_", delete=False)
+                    spool_file.write(buffer)
+                    buffer = bytearray()
                 
-        return True  # 修改：无论是否匹配，都允许其他插件处理
-
-    async def _get_user_info(self, message: dict) -> tuple:
-        """获取用户信息"""
-        user_id = message.get("SenderId") or message.get("FromWxid", "")
-        # 尝试获取用户昵称
-        user_name = message.get("SenderNickname") or message.get("FromName", "未知用户")
+                if spool_file is not None:
+                    spool_file.write(chunk)
+                else:
+                    buffer.extend(chunk)
+        except BaseException:
+            if spool_file is not None:
+                spool_file.close()
+                self._discard_body(Path(spool_file.name))
+            raise
         
-        return user_id, user_name
+        if spool_file is not None:
+            spool_file.close()
+            logger.info(f"媒体数据 {total} 字节已落盘: {spool_file.name}")
+            return Path(spool_file.name)
+        return bytes(buffer)
+    
+    def _body_size(self, body: Union[bytes, Path]) -> int:
+        """获取响应体大小（字节）"""
+        if isinstance(body, Path):
+            return body.stat().st_size
+        return len(body)
+    
+    def _sweep_spool_files(self):
+        """删除temp目录中遗留的落盘响应体，启动时调用，此时还没有任何响应持有这些文件"""
+        temp_dir = Path(__file__).parent / "temp"
+        removed = 0
+        for path in temp_dir.glob("media_*"):
+            with contextlib.suppress(OSError):
+                path.unlink()
+                removed += 1
+        if removed:
+            logger.info(f"已清理遗留的落盘响应体 {removed} 个")
+    
+    def _discard_body(self, body: Union[bytes, Path]):
+        """清理_read_body落盘产生的临时文件"""
+        if isinstance(body, Path):
+            try:
+                body.unlink(missing_ok=True)
+            except OSError as e:
+                logger.warning(f"删除临时媒体文件失败: {e}")
+    
+    def _media_policy(self, api_config: Dict[str, Any]) -> Dict[str, Any]:
+        """合并[media]段的默认值和API的media覆盖项，media = false时不检查也不压缩"""
+        policy = api_config.get("media", {})
+        if policy is False or not self.media_config.get("enabled", True):
+            return None
+        if not isinstance(policy, dict):
+            policy = {}
+        return {**self.media_config, **policy}
+    
+    async def _normalize_media(self, response: "ApiResponse", return_type: str, api_config: Dict[str, Any]) -> "ApiResponse":
+        """发送前的媒体检查：按魔数和Content-Type识别格式，拒绝非媒体数据，压缩过大的图片
         
-    def is_admin(self, user_id: str) -> bool:
-        """检查用户是否是管理员"""
-        # 这里可以根据项目的管理员判断逻辑进行调整
-        # 简单起见，先使用一个简单的判断
-        try:
-            from utils.admin import is_admin
-            return is_admin(user_id)
-        except ImportError:
-            # 如果没有专门的管理员判断函数，使用简单的判断方式
-            # 这里是假设的管理员ID列表，实际项目中应该从配置或数据库获取
-            admin_ids = ["wxid_abcdefg", "wxid_12345678"]
-            return user_id in admin_ids
+        Args:
+            response: 上游响应，调用方仍持有自己的引用
+            return_type: 期望的媒体类别，img或video
+            api_config: API配置
             
-    async def _send_test_image(self, bot: WechatAPIClient, to_wxid: str, message: str = None):
-        """发送测试图片，验证图片发送功能是否正常"""
+        Returns:
+            调用方持有一份引用的待发送响应（未压缩时就是原响应），数据无效时返回None
+        """
+        body = response.body
+        size = self._body_size(body)
+        if isinstance(body, Path):
+            with open(body, "rb") as f:
+                head = f.read(16)
+        else:
+            head = bytes(body[:16])
+        
+        policy = self._media_policy(api_config)
+        if policy is None:
+            if size < 100:
+                logger.warning(f"API返回的媒体数据可能无效，大小仅为 {size} 字节")
+                return None
+            response.refs += 1
+            return response
+        
+        category, media_format = _sniff_media(head)
+        if category is None:
+            # 魔数无法识别时以Content-Type为准，两者都不像期望的媒体就拒绝
+            content_type = response.headers.get("Content-Type", "").lower()
+            if size >= policy.get("min_bytes", 100) and content_type.startswith("image/" if return_type == "img" else "video/"):
+                category, media_format = return_type, content_type.split("/", 1)[1].split(";")[0].strip()
+        if category != return_type or size < policy.get("min_bytes", 100):
+            logger.warning(f"API返回的数据不是有效的媒体: 期望{return_type}，识别为{media_format or '未知'}，"
+                           f"Content-Type: {response.headers.get('Content-Type')}，大小 {size} 字节，开头 {head!r}")
+            return None
+        
+        max_image_bytes = policy.get("max_image_bytes", 2 * 1024 * 1024)
+        if category != "img" or media_format == "gif" or not max_image_bytes or size <= max_image_bytes:
+            response.refs += 1
+            return response
+        
+        source = str(body) if isinstance(body, Path) else body
         try:
-            # 创建临时文件目录
-            temp_dir = os.path.join(os.path.dirname(__file__), "temp")
-            os.makedirs(temp_dir, exist_ok=True)
-            
-            # 生成测试图片
-            img_size = (400, 200)
-            bg_color = (random.randint(0, 255), random.randint(0, 255), random.randint(0, 255))
-            
-            img = Image.new('RGB', img_size, color=bg_color)
-            draw = ImageDraw.Draw(img)
-            
-            # 添加文本
-            text = message or f"测试图片 {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-            text_color = (255 - bg_color[0], 255 - bg_color[1], 255 - bg_color[2])
+            shrunk = await self._offload(
+                _shrink_image, source, policy.get("max_image_side", 2048), max_image_bytes,
+                policy.get("quality", 85), policy.get("min_quality", 60), process=True
+            )
+        except Exception as e:
+            logger.warning(f"压缩图片失败，发送原图: {str(e)}")
+            response.refs += 1
+            return response
+        
+        logger.info(f"已压缩图片: {media_format} {size} -> jpeg {len(shrunk)} 字节")
+        return ApiResponse(response.status, {"Content-Type": "image/jpeg"}, shrunk)
+    
+    async def _send_text(self, bot: WechatAPIClient, to_wxid: str, content: str):
+        """把文字回复交给出站队列
+        
+        Args:
+            bot: 机器人客户端
+            to_wxid: 接收者wxid
+            content: 文字内容
+        """
+        await self._enqueue_outbound(OutboundMessage(bot, to_wxid, "text", content))
+    
+    async def _send_media(self, bot: WechatAPIClient, to_wxid: str, return_type: str, response: "ApiResponse", send_type: str = "bytes"):
+        """把图片或视频交给出站队列，队列持有响应的一份引用，发送结束后释放
+        
+        Args:
+            bot: 机器人客户端
+            to_wxid: 接收者wxid
+            return_type: img或video
+            response: 响应体为内存中的bytes或落盘后的文件路径
+            send_type: bytes或base64；落盘的文件直接以路径交给客户端读取
+        """
+        response.refs += 1
+        await self._enqueue_outbound(OutboundMessage(bot, to_wxid, return_type, response, send_type))
+    
+    async def _enqueue_outbound(self, item: "OutboundMessage"):
+        """消息入队后立即返回；队列积压超过max_pending时等待出现空位"""
+        max_pending = self.outbox_config.get("max_pending", 500)
+        while self._outbox_size >= max_pending:
+            self._outbox_space.clear()
+            await self._outbox_space.wait()
+        
+        if not self._outbox_workers:
+            self._outbox_workers = [self._spawn(self._outbox_worker()) for _ in range(max(1, self.outbox_config.get("workers", 2)))]
+        
+        self._outbox_size += 1
+        queue = self._outbox.get(item.to_wxid)
+        if queue is None:
+            queue = self._outbox[item.to_wxid] = deque()
+        queue.append(item)
+        if len(queue) == 1:
+            # 该接收者此前没有待发送消息，立即就绪；否则等前面的消息发完
+            self._mark_outbox_ready(item.to_wxid)
+    
+    def _mark_outbox_ready(self, to_wxid: str):
+        """接收者的队首消息可以发送了"""
+        queue = self._outbox.get(to_wxid)
+        if not queue:
+            return
+        heapq.heappush(self._outbox_ready, (queue[0].priority, next(self._outbox_seq), to_wxid))
+        self._outbox_wakeup.set()
+    
+    async def _outbox_worker(self):
+        """出站队列的发送协程
+        
+        同一接收者同一时间只有队首一条消息在发送，保证消息顺序，且两条消息之间至少间隔chat_interval秒；
+        不同接收者之间按优先级调度，整体发送速率受全局令牌桶（rate/burst）限制。网络错误导致的发送失败以指数退避原地重试，重试期间该接收者的后续消息继续等待；
+        其他异常可能发生在消息已经发出之后，不重试，避免重复发送。
+        """
+        while True:
+            while not self._outbox_ready:
+                self._outbox_wakeup.clear()
+                await self._outbox_wakeup.wait()
+            _, _, to_wxid = heapq.heappop(self._outbox_ready)
+            queue = self._outbox.get(to_wxid)
+            if not queue:
+                continue
+            item = queue[0]
             
-            # 尝试加载字体，如果失败则使用默认字体
-            try:
-                font = ImageFont.truetype("arial.ttf", 20)
-                draw.text((20, 80), text, fill=text_color, font=font)
-            except:
-                draw.text((20, 80), text, fill=text_color)
+            # 该接收者还在间隔期内时稍后再排队，不占用发送协程
+            now = time.monotonic()
+            wait = self._outbox_chat_next.get(to_wxid, 0.0) - now
+            if wait > 0:
+                asyncio.get_running_loop().call_later(wait, self._mark_outbox_ready, to_wxid)
+                continue
             
-            # 保存图片
-            test_img_path = os.path.join(temp_dir, "test_image.jpg")
-            img.save(test_img_path)
+            # 全局令牌桶，rate <= 0表示不限制
+            rate = self.outbox_config.get("rate", 20)
+            if rate > 0:
+                if self._outbox_bucket is None:
+                    self._outbox_bucket = TokenBucket(rate, self.outbox_config.get("burst", 40))
+                while not self._outbox_bucket.available():
+                    await asyncio.sleep(self._outbox_bucket.retry_after())
+                self._outbox_bucket.take()
+            self._outbox_chat_next.put(to_wxid, time.monotonic() + self.outbox_config.get("chat_interval", 1.0))
             
-            # 发送图片
+            error = None
+            started = time.monotonic()
             try:
-                logger.info(f"发送测试图片: {test_img_path}")
-                result = await bot.send_image_message(to_wxid, test_img_path)
-                client_img_id, create_time, new_msg_id = result
-                logger.info(f"测试图片发送结果: ClientImgId: {client_img_id}, MsgId: {new_msg_id}")
-                
-                # 等待一段时间，检查图片是否真正发送成功
-                await asyncio.sleep(2)  # 等待2秒
-                
-                if not message:  # 只有在直接测试时才发送成功消息
-                    await bot.send_text_message(to_wxid, f"✅ 测试图片发送成功\nClientImgId: {client_img_id}\nMsgId: {new_msg_id}")
+                await self._deliver(item)
+                self._observe("apiinterface_send_duration_seconds", (("kind", item.kind),), time.monotonic() - started)
+            except asyncio.CancelledError:
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError, ConnectionError) as e:
+                self._count("apiinterface_send_failures_total", (("kind", item.kind),))
+                item.attempts += 1
+                if item.attempts < self.outbox_config.get("max_attempts", 3):
+                    delay = self.outbox_config.get("retry_delay", 2) * 2 ** (item.attempts - 1)
+                    logger.warning(f"发送消息失败，{delay}秒后第{item.attempts}次重试: {to_wxid}: {str(e)}")
+                    asyncio.get_running_loop().call_later(delay, self._mark_outbox_ready, to_wxid)
+                    continue
+                error = e
             except Exception as e:
-                logger.error(f"测试图片发送失败: {e}")
-                
-                if not message:  # 只有在直接测试时才发送失败消息
-                    await bot.send_text_message(to_wxid, f"❌ 测试图片发送失败: {str(e)}")
-                
-                # 尝试使用字节方式发送
-                try:
-                    with open(test_img_path, "rb") as f:
-                        img_bytes = f.read()
-                    retry_result = await bot.send_image_message(to_wxid, img_bytes)
-                    logger.info(f"使用字节数据重试发送测试图片: {retry_result}")
-                    
-                    # 等待一段时间，检查重试是否成功
-                    await asyncio.sleep(2)  # 等待2秒
-                    
-                    if not message:  # 只有在直接测试时才发送成功消息
-                        await bot.send_text_message(to_wxid, f"✅ 测试图片(字节方式)发送成功: {retry_result}")
-                except Exception as retry_e:
-                    logger.error(f"重试发送测试图片失败: {retry_e}")
-                    
-                    if not message:  # 只有在直接测试时才发送失败消息
-                        await bot.send_text_message(to_wxid, f"❌ 重试测试图片发送也失败: {str(retry_e)}")
-        except Exception as e:
-            logger.error(f"生成测试图片失败: {e}")
-            if not message:  # 只有在直接测试时才发送失败消息
-                await bot.send_text_message(to_wxid, f"❌ 生成测试图片失败: {str(e)}")
-
-    async def _call_api(self, bot: WechatAPIClient, to_wxid: str, cmd: str, api_config: Dict[str, Any]):
-        """调用API接口并处理结果"""
-        try:
-            url = api_config.get("url")
-            method = api_config.get("method", "get").lower()
-            return_type = api_config.get("return_type", "text").lower()
-            params = api_config.get("params", {})
-            send_type = api_config.get("send_type", "bytes").lower()  # 默认使用字节方式
+                self._count("apiinterface_send_failures_total", (("kind", item.kind),))
+                error = e
             
-            logger.info(f"调用API: {url}, 方法: {method}, 返回类型: {return_type}, 发送方式: {send_type}, 参数: {params}")
+            queue.popleft()
+            self._finish_outbound(item)
+            if queue:
+                self._mark_outbox_ready(to_wxid)
+            else:
+                del self._outbox[to_wxid]
             
-            async with aiohttp.ClientSession() as session:
-                if method == "get":
-                    # 设置超时
-                    timeout = aiohttp.ClientTimeout(total=15)  # 总超时15秒
-                    
-                    async with session.get(url, params=params, timeout=timeout) as response:
-                        if response.status != 200:
-                            logger.warning(f"API响应状态码异常: {response.status}")
-                            await bot.send_text_message(to_wxid, f"⚠️ API响应异常: {response.status}")
-                            return
-                            
-                        if return_type == "img":
-                            # 读取图片数据
-                            img_data = await response.read()
-                            
-                            # 验证图片数据有效性
-                            if len(img_data) < 100:  # 一个有效图片通常至少有几百字节
-                                logger.warning(f"API返回的图片数据可能无效，大小仅为 {len(img_data)} 字节")
-                                logger.info(f"API返回数据前100字节: {img_data[:100]}")
-                                await bot.send_text_message(to_wxid, f"⚠️ API返回的图片数据无效")
-                                return
-                            
-                            # 根据配置的发送方式处理图片数据
-                            try:
-                                if send_type == "base64":
-                                    img_base64 = base64.b64encode(img_data).decode('utf-8')
-                                    result = await bot.send_image_message(to_wxid, img_base64)
-                                else:  # 默认使用字节方式
-                                    result = await bot.send_image_message(to_wxid, img_data)
-                                    
-                                client_img_id, create_time, new_msg_id = result
-                                logger.info(f"已发送图片，ClientImgId: {client_img_id}, MsgId: {new_msg_id}")
-                            except Exception as img_e:
-                                logger.error(f"发送图片时发生错误: {img_e}")
-                                await bot.send_text_message(to_wxid, f"⚠️ 发送图片失败: {str(img_e)}")
-                        elif return_type == "video":
-                            # 读取视频数据
-                            video_data = await response.read()
-                            
-                            # 验证视频数据有效性
-                            if len(video_data) < 100:  # 一个有效视频通常至少有几百字节
-                                logger.warning(f"API返回的视频数据可能无效，大小仅为 {len(video_data)} 字节")
-                                logger.info(f"API返回数据前100字节: {video_data[:100]}")
-                                await bot.send_text_message(to_wxid, f"⚠️ API返回的视频数据无效")
-                                return
-                            
-                            # 根据配置的发送方式处理视频数据
-                            try:
-                                if send_type == "base64":
-                                    video_base64 = base64.b64encode(video_data).decode('utf-8')
-                                    result = await bot.send_video_message(to_wxid, video_base64)
-                                else:  # 默认使用字节方式
-                                    result = await bot.send_video_message(to_wxid, video_data)
-                                    
-                                # 处理返回值，适应不同的返回值格式
-                                if isinstance(result, tuple):
-                                    if len(result) == 3:
-                                        client_video_id, create_time, new_msg_id = result
-                                        logger.info(f"已发送视频，ClientVideoId: {client_video_id}, MsgId: {new_msg_id}")
-                                    elif len(result) == 2:
-                                        client_video_id, new_msg_id = result
-                                        logger.info(f"已发送视频，ClientVideoId: {client_video_id}, MsgId: {new_msg_id}")
-                                    else:
-                                        logger.warning(f"视频发送返回值格式未知: {result}")
-                                else:
-                                    logger.warning(f"视频发送返回值类型未知: {type(result)}")
-                            except Exception as video_e:
-                                logger.error(f"发送视频时发生错误: {video_e}")
-                                await bot.send_text_message(to_wxid, f"⚠️ 发送视频失败: {str(video_e)}")
-                        elif return_type == "json":
-                            # 处理JSON返回
-                            try:
-                                # 先尝试直接解析JSON
-                                json_data = await response.json()
-                            except Exception as json_e:
-                                # 如果直接解析失败，尝试从HTML中提取JSON
-                                text = await response.text()
-                                logger.info(f"API返回原始数据: {text[:200]}...")  # 只记录前200个字符
-                                try:
-                                    # 尝试从文本中提取JSON
-                                    import re
-                                    json_match = re.search(r'\{.*\}', text, re.DOTALL)
-                                    if json_match:
-                                        json_str = json_match.group(0)
-                                        import json
-                                        json_data = json.loads(json_str)
-                                    else:
-                                        raise ValueError("无法从响应中提取JSON数据")
-                                except Exception as extract_e:
-                                    logger.error(f"解析JSON失败: {extract_e}")
-                                    await bot.send_text_message(to_wxid, f"⚠️ API返回数据格式错误: {str(extract_e)}")
-                                    return
-                            
-                            logger.info(f"API返回JSON数据: {json_data}")
-                            
-                            # 处理星座运势数据
-                            if cmd == "星座" and isinstance(json_data, dict):
-                                if json_data.get("code") == 200 and "data" in json_data:
-                                    data = json_data["data"]
-                                    reply = f"✨ {data.get('title', '星座运势')} ✨\n"
-                                    reply += f"日期：{data.get('time', '未知')}\n"
-                                    reply += f"综合运势：{data.get('shortcomment', '未知')}\n"
-                                    reply += f"幸运数字：{data.get('luckynumber', '未知')}\n"
-                                    reply += f"幸运颜色：{data.get('luckycolor', '未知')}\n"
-                                    reply += f"幸运星座：{data.get('luckyconstellation', '未知')}\n"
-                                    reply += f"健康指数：{data.get('health', '未知')}\n"
-                                    reply += f"讨论指数：{data.get('discuss', '未知')}\n\n"
-                                    reply += "详细运势：\n"
-                                    reply += f"💫 整体运势：{data.get('alltext', '未知')}\n"
-                                    reply += f"💕 爱情运势：{data.get('lovetext', '未知')}\n"
-                                    reply += f"💼 事业运势：{data.get('worktext', '未知')}\n"
-                                    reply += f"💰 财运运势：{data.get('moneytext', '未知')}\n"
-                                    reply += f"🏃 健康运势：{data.get('healthtxt', '未知')}\n"
-                                    await bot.send_text_message(to_wxid, reply)
-                                    return
-                            
-                            # 处理短剧搜索数据
-                            if cmd == "短剧" and isinstance(json_data, dict):
-                                if json_data.get("code") == 200 and "data" in json_data:
-                                    return json_data  # 返回完整的JSON数据，让_handle_drama处理
-                            
-                            # 检查JSON数据中是否包含视频URL
-                            if isinstance(json_data, dict):
-                                # 尝试从不同路径获取视频URL
-                                video_url = None
-                                if "data" in json_data and isinstance(json_data["data"], dict):
-                                    if "videourl" in json_data["data"]:
-                                        video_url = json_data["data"]["videourl"]
-                                    elif "url" in json_data["data"]:
-                                        video_url = json_data["data"]["url"]
-                                elif "videourl" in json_data:
-                                    video_url = json_data["videourl"]
-                                elif "url" in json_data:
-                                    video_url = json_data["url"]
-                                
-                                if video_url:
-                                    logger.info(f"从JSON中获取到视频URL: {video_url}")
-                                    
-                                    # 下载视频
-                                    async with session.get(video_url) as media_response:
-                                        if media_response.status == 200:
-                                            media_data = await media_response.read()
-                                            
-                                            # 根据配置的发送方式处理视频数据
-                                            try:
-                                                if send_type == "base64":
-                                                    video_base64 = base64.b64encode(media_data).decode('utf-8')
-                                                    result = await bot.send_video_message(to_wxid, video_base64)
-                                                else:  # 默认使用字节方式
-                                                    result = await bot.send_video_message(to_wxid, media_data)
-                                                    
-                                                # 处理返回值，适应不同的返回值格式
-                                                if isinstance(result, tuple):
-                                                    if len(result) == 3:
-                                                        client_id, create_time, new_msg_id = result
-                                                        logger.info(f"已发送视频，ClientVideoId: {client_id}, MsgId: {new_msg_id}")
-                                                    elif len(result) == 2:
-                                                        client_id, new_msg_id = result
-                                                        logger.info(f"已发送视频，ClientVideoId: {client_id}, MsgId: {new_msg_id}")
-                                                    else:
-                                                        logger.warning(f"视频发送返回值格式未知: {result}")
-                                                else:
-                                                    logger.warning(f"视频发送返回值类型未知: {type(result)}")
-                                            except Exception as video_e:
-                                                logger.error(f"发送视频时发生错误: {video_e}")
-                                                await bot.send_text_message(to_wxid, f"⚠️ 发送视频失败: {str(video_e)}")
-                                        else:
-                                            logger.error(f"下载视频失败，状态码: {media_response.status}")
-                                            await bot.send_text_message(to_wxid, f"⚠️ 下载视频失败: {media_response.status}")
-                                else:
-                                    # 如果不是视频URL，直接返回JSON数据
-                                    return json_data
-                            else:
-                                # 如果不是字典类型，直接返回数据
-                                return json_data
-                        else:
-                            # 处理文本返回
-                            text = await response.text()
-                            await bot.send_text_message(to_wxid, text)
-                            logger.info(f"已发送文本: {text[:100]}...")
-                else:
-                    logger.error(f"不支持的请求方法: {method}")
-                    await bot.send_text_message(to_wxid, f"⚠️ 不支持的请求方法: {method}")
-                    return
-        except aiohttp.ClientError as http_err:
-            logger.error(f"HTTP请求错误: {http_err}")
-            await bot.send_text_message(to_wxid, f"⚠️ API请求失败: {str(http_err)}")
-        except asyncio.TimeoutError:
-            logger.error("API请求超时")
-            await bot.send_text_message(to_wxid, f"⚠️ API请求超时，请稍后重试")
-        except Exception as e:
-            logger.error(f"调用API失败: {str(e)}")
-            await bot.send_text_message(to_wxid, f"⚠️ 调用API失败: {str(e)}")
+            if error is not None:
+                logger.error(f"发送消息失败，已放弃: {to_wxid}: {str(error)}")
+                if item.kind != "text":
+                    media_label = "图片" if item.kind == "img" else "视频"
+                    await self._send_text(item.bot, to_wxid, f"⚠️ 发送{media_label}失败: {str(error)}")
+    
+    def _finish_outbound(self, item: "OutboundMessage"):
+        """消息离开队列：释放媒体响应的引用并唤醒等待空位的入队者"""
+        if item.kind != "text":
+            self._release_response(item.payload)
+        self._outbox_size -= 1
+        self._outbox_space.set()
+    
+    def _clear_outbox(self):
+        """丢弃所有未发出的消息"""
+        for queue in self._outbox.values():
+            for item in queue:
+                self._finish_outbound(item)
+        self._outbox.clear()
+        self._outbox_ready = []
+    
+    async def _deliver(self, item: "OutboundMessage"):
+        """调用客户端发送一条消息，失败时抛出异常由发送协程决定是否重试；发送成功后不再抛出异常"""
+        if item.kind == "text":
+            await item.bot.send_text_message(item.to_wxid, item.payload)
+            return
+        
+        media = item.payload.body
+        if item.send_type != "base64":  # 默认使用字节方式
+            payload = media
+        elif isinstance(media, Path):
+            # 落盘的大文件也在线程池中读取和编码，不交给客户端在事件循环中处理
+            payload = await self._offload(_b64encode_file, media)
+        else:
+            # 以memoryview交给线程池编码，不复制多MB的视频数据
+            payload = await self._offload(_b64encode_text, memoryview(media), size=len(media))
+        
+        if item.kind == "img":
+            result = await item.bot.send_image_message(item.to_wxid, payload)
+            
+            # 处理返回值，适应不同的返回值格式
+            if isinstance(result, tuple) and len(result) in (2, 3):
+                logger.info(f"已发送图片，ClientImgId: {result[0]}, MsgId: {result[-1]}")
+            else:
+                logger.warning(f"图片发送返回值格式未知: {result}")
+            return
+        
+        result = await item.bot.send_video_message(item.to_wxid, payload)
+        
+        # 处理返回值，适应不同的返回值格式
+        if isinstance(result, tuple):
+            if len(result) == 3:
+                client_video_id, create_time, new_msg_id = result
+                logger.info(f"已发送视频，ClientVideoId: {client_video_id}, MsgId: {new_msg_id}")
+            elif len(result) == 2:
+                client_video_id, new_msg_id = result
+                logger.info(f"已发送视频，ClientVideoId: {client_video_id}, MsgId: {new_msg_id}")
+            else:
+                logger.warning(f"视频发送返回值格式未知: {result}")
+        else:
+            logger.warning(f"视频发送返回值类型未知: {type(result)}")
 
     async def _handle_constellation(self, bot, message, params):
-        """处理星座运势请求"""
+        """处理星座运势请求，优先使用当天已预热的回复"""
         if not params:
-            await bot.send_text_message(message["FromWxid"], "请直接发送星座名称，例如：白羊")
+            await self._send_text(bot, message["FromWxid"], "请直接发送星座名称，例如：白羊")
             return
 
-        # 星座名称映射（已不需要检查，因为在handle_text已经检查过）
-        constellation_map = {
-            "白羊": "白羊", "金牛": "金牛", "双子": "双子", "巨蟹": "巨蟹",
-            "狮子": "狮子", "处女": "处女", "天秤": "天秤", "天蝎": "天蝎",
-            "射手": "射手", "摩羯": "摩羯", "水瓶": "水瓶", "双鱼": "双鱼"
-        }
-
         # 获取API配置
+        if not self.api_configs.get("星座"):
+            await self._send_text(bot, message["FromWxid"], "星座运势接口配置错误")
+            return
+
+        cached = self._horoscopes.get(params)
+        if cached is not None and cached[0] >= self._horoscope_day():
+            await self._send_text(bot, message["FromWxid"], cached[1])
+            return
+
+        # 当天尚未预热成功时实时获取，上游出错时退回之前的回复并注明日期
+        entry = await self._fetch_horoscope(params)
+        if entry is not None:
+            await self._send_text(bot, message["FromWxid"], entry[1])
+        elif cached is not None:
+            stale = f"⚠️ 暂时无法获取最新运势，以下是{cached[0].isoformat()}的运势\n\n"
+            await self._send_text(bot, message["FromWxid"], stale + cached[1])
+        else:
+            await self._send_text(bot, message["FromWxid"], "获取星座运势失败，请稍后重试")
+
+    def _horoscope_now(self) -> datetime.datetime:
+        """上游换日所用时区的当前时间"""
+        offset = datetime.timedelta(hours=self.horoscope_config.get("utc_offset", 8))
+        return datetime.datetime.now(datetime.timezone(offset))
+
+    def _horoscope_day(self) -> datetime.date:
+        """上游当前应提供的运势日期，换日时间rollover之前仍是前一天"""
+        now = self._horoscope_now()
+        if now < self._horoscope_time(now.date(), "rollover", "00:05"):
+            return now.date() - datetime.timedelta(days=1)
+        return now.date()
+
+    def _horoscope_time(self, day: datetime.date, key: str, default: str) -> datetime.datetime:
+        """把配置中的"HH:MM"换算为上游时区中指定日期的时刻"""
+        hour, minute = (int(part) for part in self.horoscope_config.get(key, default).split(":"))
+        now = self._horoscope_now()
+        return datetime.datetime.combine(day, datetime.time(hour, minute), now.tzinfo)
+
+    async def _fetch_horoscope(self, name: str) -> tuple:
+        """获取一个星座的运势并保存格式化后的回复
+
+        不经过响应缓存（缓存中可能还是换日前的数据），但相同星座的并发请求仍会合并。
+        回复按上游数据中time字段的日期保存，无法解析时按上游当前应提供的日期保存。
+
+        Args:
+            name: 星座名
+
+        Returns:
+            (运势日期, 回复文本)，失败时返回None
+        """
         api_config = self.api_configs.get("星座")
         if not api_config:
-            await bot.send_text_message(message["FromWxid"], "星座运势接口配置错误")
-            return
+            return None
+        api_config_copy = api_config.copy()
+        api_config_copy["params"] = {"xz": name}
+        api_config_copy["cache"] = False
 
-        # 调用API
+        day = self._horoscope_day()
+        started = time.monotonic()
         try:
-            # 创建一个新的配置副本
-            api_config_copy = api_config.copy()
-            # 添加参数
-            api_config_copy["params"] = {"xz": params}
-            
-            result = await self._call_api(bot, message["FromWxid"], "星座", api_config_copy)
-            if result and isinstance(result, dict):
-                if result.get("code") == 200 and "data" in result:
-                    data = result["data"]
-                    reply = f"✨ {data.get('title', '星座运势')} ✨\n"
-                    reply += f"日期：{data.get('time', '未知')}\n"
-                    reply += f"综合运势：{data.get('shortcomment', '未知')}\n"
-                    reply += f"幸运数字：{data.get('luckynumber', '未知')}\n"
-                    reply += f"幸运颜色：{data.get('luckycolor', '未知')}\n"
-                    reply += f"幸运星座：{data.get('luckyconstellation', '未知')}\n"
-                    reply += f"健康指数：{data.get('health', '未知')}\n"
-                    reply += f"讨论指数：{data.get('discuss', '未知')}\n\n"
-                    reply += "详细运势：\n"
-                    reply += f"💫 整体运势：{data.get('alltext', '未知')}\n"
-                    reply += f"💕 爱情运势：{data.get('lovetext', '未知')}\n"
-                    reply += f"💼 事业运势：{data.get('worktext', '未知')}\n"
-                    reply += f"💰 财运运势：{data.get('moneytext', '未知')}\n"
-                    reply += f"🏃 健康运势：{data.get('healthtxt', '未知')}\n"
-                    await bot.send_text_message(message["FromWxid"], reply)
-                else:
-                    await bot.send_text_message(message["FromWxid"], "获取星座运势失败，请稍后重试")
-            else:
-                await bot.send_text_message(message["FromWxid"], "获取星座运势失败，请稍后重试")
+            response = await self._fetch("星座", api_config_copy)
+            try:
+                if response.status != 200:
+                    logger.warning(f"获取星座运势响应状态码异常 [{name}]: {response.status}")
+                    return None
+                result = await self._decode_json(response)
+            finally:
+                self._release_response(response)
         except Exception as e:
-            logger.error(f"获取星座运势失败: {str(e)}")
-            await bot.send_text_message(message["FromWxid"], "获取星座运势失败，请稍后重试")
+            logger.error(f"获取星座运势失败 [{name}]: {str(e)}")
+            return None
+        finally:
+            self._observe("apiinterface_api_duration_seconds", (("api", "星座"),), time.monotonic() - started)
+
+        if not isinstance(result, dict) or result.get("code") != 200 or not isinstance(result.get("data"), dict):
+            logger.warning(f"星座运势返回数据异常 [{name}]: {result}")
+            return None
+        data = result["data"]
+        entry = (_parse_horoscope_date(data.get("time")) or day, _format_horoscope(data))
+        self._horoscopes[name] = entry
+        return entry
+
+    async def _warm_horoscopes(self):
+        """重新获取全部12星座的运势，失败或上游仍是旧数据的星座在retry_until之前按retry_delay重试"""
+        semaphore = asyncio.Semaphore(self.horoscope_config.get("concurrency", 3))
+        retry_delay = self.horoscope_config.get("retry_delay", 300)
+        day = self._horoscope_day()
+        retry_until = self._horoscope_time(self._horoscope_now().date(), "retry_until", "07:00")
+
+        async def warm(name: str) -> bool:
+            async with semaphore:
+                entry = await self._fetch_horoscope(name)
+            return entry is not None and entry[0] >= day
+
+        # 已有的回复可能是换日前实时获取的，第一轮不论是否已有都重新获取
+        pending = list(self.constellations)
+        attempt = 0
+        while True:
+            attempt += 1
+            results = await asyncio.gather(*(warm(name) for name in pending))
+            failed = [name for name, ok in zip(pending, results) if not ok]
+            self._count("apiinterface_horoscope_warmups_total", (("result", "ok"),), len(pending) - len(failed))
+            if not failed:
+                logger.info(f"星座运势预热完成，共{attempt}轮")
+                return
+            self._count("apiinterface_horoscope_warmups_total", (("result", "failed"),), len(failed))
+            if self._horoscope_now() + datetime.timedelta(seconds=retry_delay) > retry_until:
+                logger.warning(f"星座运势预热未完成，放弃重试: {'、'.join(failed)}")
+                return
+            logger.warning(f"星座运势预热失败，{retry_delay}秒后重试: {'、'.join(failed)}")
+            pending = failed
+            await asyncio.sleep(retry_delay)
+
+    async def _warm_horoscopes_daily(self):
+        """每天在上游换日后（rollover加上随机的jitter秒）预热12星座运势，启动时先补一次当天的数据"""
+        jitter = self.horoscope_config.get("jitter", 300)
+        while True:
+            try:
+                await self._warm_horoscopes()
+            except Exception as e:
+                logger.error(f"星座运势预热失败: {str(e)}")
+
+            now = self._horoscope_now()
+            next_run = self._horoscope_time(now.date(), "rollover", "00:05")
+            if next_run <= now:
+                next_run = self._horoscope_time(now.date() + datetime.timedelta(days=1), "rollover", "00:05")
+            delay = (next_run - now).total_seconds() + random.uniform(0, jitter)
+            logger.info(f"下次星座运势预热在{delay:.0f}秒后")
+            await asyncio.sleep(delay)
 
     async def _handle_drama(self, bot, message, params):
         """处理短剧搜索请求"""
         if not params:
-            await bot.send_text_message(message["FromWxid"], "请指定搜索关键词，例如：短剧总裁")
+            await self._send_text(bot, message["FromWxid"], "请指定搜索关键词，例如：短剧总裁")
             return
 
         # 检查是否是显示剩余结果的命令
         if params.startswith("显示剩余"):
-            # 从缓存中获取上次搜索结果
-            if not hasattr(self, '_drama_cache') or not self._drama_cache:
-                await bot.send_text_message(message["FromWxid"], "没有可显示的剩余结果，请先进行搜索")
-                return
-            
-            dramas = self._drama_cache
-            if len(dramas) <= 5:
-                await bot.send_text_message(message["FromWxid"], "没有更多结果了")
-                return
-
-            # 构建剩余结果的回复消息
-            reply = f"📺 搜索关键词：{self._last_search_keyword}\n"
-            reply += f"显示剩余 {len(dramas) - 5} 部短剧：\n\n"
-            
-            for i, drama in enumerate(dramas[5:], 6):  # 从第6部开始显示
-                reply += f"{i}. {drama.get('title', '未知')}\n"
-                reply += f"   主演：{drama.get('author', '未知')}\n"
-                reply += f"   类型：{drama.get('type', '未知')}\n"
-                reply += f"   简介：{drama.get('intro', '未知')}\n"
-                reply += f"   链接：{drama.get('link', '未知')}\n\n"
-
-            await bot.send_text_message(message["FromWxid"], reply)
+            await self._handle_next_page(bot, message, "drama")
             return
 
-        # 获取API配置
-        api_config = self.api_configs.get("短剧")
-        if not api_config:
-            await bot.send_text_message(message["FromWxid"], "短剧搜索接口配置错误")
+        if not self.api_configs.get("短剧"):
+            await self._send_text(bot, message["FromWxid"], "短剧搜索接口配置错误")
             return
 
-        # 设置搜索参数
-        api_config_copy = api_config.copy()  # 创建副本以避免修改原始配置
-        api_config_copy["params"] = {"name": params}
-
         # 调用API
         try:
-            result = await self._call_api(bot, message["FromWxid"], "短剧", api_config_copy)
-            if result and isinstance(result, dict):
-                if result.get("code") == 200 and "data" in result:
-                    dramas = result["data"]
-                    if not dramas:
-                        await bot.send_text_message(message["FromWxid"], f'未找到与"{params}"相关的短剧')
-                        return
-
-                    # 保存搜索结果到缓存
-                    self._drama_cache = dramas
-                    self._last_search_keyword = params
-
-                    # 构建回复消息
-                    reply = f"📺 搜索关键词：{params}\n"
-                    reply += f"找到 {len(dramas)} 部相关短剧：\n\n"
-                    
-                    for i, drama in enumerate(dramas[:5], 1):  # 只显示前5部
-                        reply += f"{i}. {drama.get('title', '未知')}\n"
-                        reply += f"   主演：{drama.get('author', '未知')}\n"
-                        reply += f"   类型：{drama.get('type', '未知')}\n"
-                        reply += f"   简介：{drama.get('intro', '未知')}\n"
-                        reply += f"   链接：{drama.get('link', '未知')}\n\n"
-
-                    if len(dramas) > 5:
-                        reply += f"... 还有 {len(dramas) - 5} 部更多结果\n"
-                        reply += "发送\"显示剩余\"可查看剩余结果"
-
-                    await bot.send_text_message(message["FromWxid"], reply)
-                else:
-                    await bot.send_text_message(message["FromWxid"], "搜索短剧失败，请稍后重试")
+            dramas = await self._search_upstream(bot, message["FromWxid"], "drama", params, self.api_configs["短剧"].get("page_start", 1))
+            if dramas is None:
+                await self._send_text(bot, message["FromWxid"], "搜索短剧失败，请稍后重试")
+            elif not dramas:
+                await self._send_text(bot, message["FromWxid"], f'未找到与"{params}"相关的短剧')
             else:
-                await bot.send_text_message(message["FromWxid"], "搜索短剧失败，请稍后重试")
+                await self._open_search_session(bot, message, "drama", params, dramas)
         except Exception as e:
             logger.error(f"搜索短剧失败: {str(e)}")
-            await bot.send_text_message(message["FromWxid"], "搜索短剧失败，请稍后重试")
+            await self._send_text(bot, message["FromWxid"], "搜索短剧失败，请稍后重试")
             
     @on_at_message(priority=100)
     async def handle_at(self, bot: WechatAPIClient, message: dict):
@@ -939,7 +3778,7 @@ class APIInterface(PluginBase):
         
         # 检查权限
         if not self.is_admin(user_id):
-            await bot.send_text_message(from_wxid, "⚠️ 权限不足，只有管理员可以添加API")
+            await self._send_text(bot, from_wxid, "⚠️ 权限不足，只有管理员可以添加API")
             return
         
         # 解析API信息
@@ -947,7 +3786,7 @@ class APIInterface(PluginBase):
             # 格式: 添加API 命令 URL 请求方法 返回类型 描述
             parts = content.split(" ")
             if len(parts) < 5:
-                await bot.send_text_message(from_wxid, "⚠️ 格式错误，正确格式: 添加API 命令 URL 请求方法 返回类型 描述")
+                await self._send_text(bot, from_wxid, "⚠️ 格式错误，正确格式: 添加API 命令 URL 请求方法 返回类型 描述")
                 return
             
             cmd = parts[2]
@@ -964,13 +3803,14 @@ class APIInterface(PluginBase):
                 "description": description
             }
             
-            # 保存配置
-            self._save_api_config()
+            # 保存配置并重新编译命令分发表
+            self._schedule_save(self.api_config_path)
+            self._build_dispatcher()
             
-            await bot.send_text_message(from_wxid, f"✅ 成功添加API: {cmd}\nURL: {url}\n方法: {method}\n返回类型: {return_type}\n描述: {description}")
+            await self._send_text(bot, from_wxid, f"✅ 成功添加API: {cmd}\nURL: {url}\n方法: {method}\n返回类型: {return_type}\n描述: {description}")
         except Exception as e:
             logger.error(f"添加API失败: {str(e)}")
-            await bot.send_text_message(from_wxid, f"⚠️ 添加API失败: {str(e)}")
+            await self._send_text(bot, from_wxid, f"⚠️ 添加API失败: {str(e)}")
     
     async def _remove_api(self, bot: WechatAPIClient, message: dict):
         """删除API接口"""
@@ -980,7 +3820,7 @@ class APIInterface(PluginBase):
         
         # 检查权限
         if not self.is_admin(user_id):
-            await bot.send_text_message(from_wxid, "⚠️ 权限不足，只有管理员可以删除API")
+            await self._send_text(bot, from_wxid, "⚠️ 权限不足，只有管理员可以删除API")
             return
         
         # 解析API信息
@@ -988,26 +3828,27 @@ class APIInterface(PluginBase):
             # 格式: 删除API 命令
             parts = content.split(" ")
             if len(parts) < 3:
-                await bot.send_text_message(from_wxid, "⚠️ 格式错误，正确格式: 删除API 命令")
+                await self._send_text(bot, from_wxid, "⚠️ 格式错误，正确格式: 删除API 命令")
                 return
             
             cmd = parts[2]
             
             # 检查API是否存在
             if cmd not in self.api_configs:
-                await bot.send_text_message(from_wxid, f"⚠️ API不存在: {cmd}")
+                await self._send_text(bot, from_wxid, f"⚠️ API不存在: {cmd}")
                 return
             
             # 删除API
             del self.api_configs[cmd]
             
-            # 保存配置
-            self._save_api_config()
+            # 保存配置并重新编译命令分发表
+            self._schedule_save(self.api_config_path)
+            self._build_dispatcher()
             
-            await bot.send_text_message(from_wxid, f"✅ 成功删除API: {cmd}")
+            await self._send_text(bot, from_wxid, f"✅ 成功删除API: {cmd}")
         except Exception as e:
             logger.error(f"删除API失败: {str(e)}")
-            await bot.send_text_message(from_wxid, f"⚠️ 删除API失败: {str(e)}")
+            await self._send_text(bot, from_wxid, f"⚠️ 删除API失败: {str(e)}")
     
     async def _list_api(self, bot: WechatAPIClient, message: dict):
         """列出所有API接口和命令"""
@@ -1020,19 +3861,20 @@ class APIInterface(PluginBase):
             command = parts[1]
             # 获取命令配置
             command_config = self._get_command_config(command)
+            reply = ""
             if command_config:
-                reply = f"📋 命令详情: {command}\n"
+                reply += f"📋 命令详情: {command}\n"
                 reply += f"📝 描述: {command_config.get('description', '无描述')}\n"
                 reply += f"📖 用法: {command_config.get('usage', command)}\n"
                 reply += f"🔒 管理员限定: {'是' if command_config.get('admin_only', False) else '否'}\n"
                 reply += f"🔍 隐藏命令: {'是' if command_config.get('hidden', False) else '否'}\n"
-                await bot.send_text_message(from_wxid, reply)
-                return
             
-            # 检查是否是API命令
+            # 检查是否是API命令，命令映射中的命令（如18+、短剧）同时显示接口详情和健康状态
             if command in self.api_configs:
                 api_config = self.api_configs[command]
-                reply = f"📡 API接口详情: {command}\n"
+                if reply:
+                    reply += "\n"
+                reply += f"📡 API接口详情: {command}\n"
                 reply += f"📝 描述: {api_config.get('description', '无描述')}\n"
                 reply += f"🔗 URL: {api_config.get('url', '未设置')}\n"
                 reply += f"📊 方法: {api_config.get('method', 'get')}\n"
@@ -1044,10 +3886,61 @@ class APIInterface(PluginBase):
                     for key, value in api_config["params"].items():
                         reply += f"  - {key}: {value}\n"
                 
-                await bot.send_text_message(from_wxid, reply)
+                # 缓存策略与命中统计
+                policy = self._cache_policy(api_config)
+                if policy:
+                    reply += f"🗃️ 缓存: {policy['ttl']}秒"
+                    stats = self._cache_stats.get(command)
+                    if stats:
+                        reply += f"，命中 {stats['hit'] + stats['stale']} / 未命中 {stats['miss']}"
+                        reply += f"（过期命中 {stats['stale']}，重验证 {stats['revalidated']}，出错降级 {stats['stale_error']}）"
+                    reply += "\n"
+                
+                coalesced = self._coalesce_stats.get(command)
+                if coalesced:
+                    reply += f"🔗 合并并发请求: {coalesced}次\n"
+                
+                breaker = self._get_breaker(api_config.get("url"))
+                if breaker is not None:
+                    if breaker.state == CircuitBreaker.OPEN:
+                        reply += f"🩺 上游状态: 熔断中，{breaker.retry_after():.0f}秒后探测恢复\n"
+                    elif breaker.state == CircuitBreaker.HALF_OPEN:
+                        reply += "🩺 上游状态: 半开，正在探测恢复\n"
+                    else:
+                        reply += "🩺 上游状态: 正常\n"
+                    reply += f"   成功 {breaker.total_successes} / 失败 {breaker.total_failures}，连续失败 {breaker.consecutive_failures}\n"
+                    if breaker.last_error:
+                        reply += f"   最近错误: {breaker.last_error}\n"
+                
+                endpoints = api_config.get("endpoints")
+                if endpoints:
+                    reply += "🔀 端点组:\n"
+                    for endpoint in endpoints:
+                        endpoint_url = self._endpoint_config(api_config, endpoint).get("url")
+                        stats = self._endpoint_stats.get(endpoint_url)
+                        if stats and stats.samples:
+                            reply += f"  - {endpoint_url}: 耗时 {stats.latency:.2f}s，错误率 {stats.error_rate:.0%}\n"
+                        else:
+                            reply += f"  - {endpoint_url}: 暂无数据\n"
+                
+                window = self._latency_windows.get(api_config.get("url"))
+                if window:
+                    reply += f"⏱️ 近期耗时: p50 {window.percentile(0.5):.2f}s，p95 {window.percentile(0.95):.2f}s"
+                    hedged = self._hedge_stats.get(api_config.get("url"))
+                    if hedged:
+                        reply += f"，对冲 {hedged}次"
+                    reply += "\n"
+                
+                prefetch_size = self._prefetch_size(command)
+                if prefetch_size > 0:
+                    ready = len(self._prefetch_pools.get(command, ()))
+                    reply += f"📦 预取缓冲: {ready}/{prefetch_size}，已命中 {self._prefetch_stats.get(command, 0)}次\n"
+            
+            if reply:
+                await self._send_text(bot, from_wxid, reply)
                 return
             
-            await bot.send_text_message(from_wxid, f"⚠️ 未找到命令或API: {command}")
+            await self._send_text(bot, from_wxid, f"⚠️ 未找到命令或API: {command}")
             return
         
         # 否则，列出所有非隐藏命令
@@ -1055,7 +3948,7 @@ class APIInterface(PluginBase):
         
         # 检查是否有可用命令
         if not visible_commands and not self.api_configs:
-            await bot.send_text_message(from_wxid, "⚠️ 当前没有可用命令和API接口")
+            await self._send_text(bot, from_wxid, "⚠️ 当前没有可用命令和API接口")
             return
         
         command_list = "📋 可用命令列表：\n"
@@ -1071,8 +3964,64 @@ class APIInterface(PluginBase):
                     command_list += f"• {cmd}: {config.get('description', '无描述')}\n"
         
         command_list += "\n💡 提示: 发送\"API列表 <命令名>\"可查看命令详情"
-        await bot.send_text_message(from_wxid, command_list)
+        await self._send_text(bot, from_wxid, command_list)
 
+    async def _show_stats(self, bot: WechatAPIClient, message: dict):
+        """显示各API的耗时分位数、上游各阶段耗时、流量、状态码、超时和缓存命中情况"""
+        from_wxid = message.get("FromWxid", "")
+        user_id, user_name = await self._get_user_info(message)
+        
+        # 检查权限
+        if not self.is_admin(user_id):
+            await self._send_text(bot, from_wxid, "⚠️ 权限不足，只有管理员可以查看API状态")
+            return
+        
+        def quantiles(histogram: "LatencyHistogram") -> str:
+            return "/".join(f"{histogram.quantile(q):.2f}" for q in (0.5, 0.95, 0.99)) + "s"
+        
+        reply = "📈 API状态（p50/p95/p99）\n"
+        for cmd, api_config in self.api_configs.items():
+            histogram = self._histograms.get(("apiinterface_api_duration_seconds", (("api", cmd),)))
+            if histogram is None:
+                continue
+            reply += f"🔹 {cmd}: {histogram.count}次，{quantiles(histogram)}\n"
+            
+            host = urllib.parse.urlsplit(api_config.get("url", "")).hostname or ""
+            labels = (("upstream", host),)
+            phases = []
+            for phase, label in (("connect", "连接"), ("ttfb", "首字节"), ("body", "响应体")):
+                phase_histogram = self._histograms.get((f"apiinterface_upstream_{phase}_seconds", labels))
+                if phase_histogram is not None:
+                    phases.append(f"{label} {quantiles(phase_histogram)}")
+            if phases:
+                reply += f"  上游 {host}: {'，'.join(phases)}\n"
+            
+            statuses = [
+                f"{dict(key_labels)['status']}×{value:.0f}"
+                for (name, key_labels), value in self._counters.items()
+                if name == "apiinterface_upstream_responses_total" and key_labels[0] == labels[0]
+            ]
+            traffic = self._counters.get(("apiinterface_upstream_bytes_total", labels), 0)
+            timeouts = self._counters.get(("apiinterface_upstream_timeouts_total", labels), 0)
+            if statuses or timeouts:
+                reply += f"  流量 {traffic / 1024 / 1024:.1f}MB，状态 {' '.join(statuses) or '无'}，超时 {timeouts:.0f}\n"
+            
+            cache_stats = self._cache_stats.get(cmd)
+            if cache_stats:
+                reply += f"  缓存: 命中 {cache_stats['hit']}，过期可用 {cache_stats['stale']}，未命中 {cache_stats['miss']}\n"
+        
+        sends = []
+        for kind, label in (("text", "文字"), ("img", "图片"), ("video", "视频")):
+            histogram = self._histograms.get(("apiinterface_send_duration_seconds", (("kind", kind),)))
+            failures = self._counters.get(("apiinterface_send_failures_total", (("kind", kind),)), 0)
+            if histogram is not None or failures:
+                sends.append(f"{label} {quantiles(histogram) if histogram else '-'}（失败 {failures:.0f}）")
+        if sends:
+            reply += f"📤 发送: {'，'.join(sends)}\n"
+        reply += f"🚦 排队拒绝: {self._shed_count}次"
+        
+        await self._send_text(bot, from_wxid, reply)
+    
     # 新增处理小说搜索的方法
     async def _handle_novel(self, bot: WechatAPIClient, message: dict, params: str):
         """处理小说搜索请求"""
@@ -1081,201 +4030,98 @@ class APIInterface(PluginBase):
         # 获取API配置
         api_config = self.api_configs.get("小说")
         if not api_config:
-            await bot.send_text_message(from_wxid, "小说搜索接口配置错误")
+            await self._send_text(bot, from_wxid, "小说搜索接口配置错误")
             return
             
-        # 设置搜索参数
-        api_config_copy = api_config.copy()  # 创建副本以避免修改原始配置
-        api_config_copy["params"] = {"name": params, "type": "json"}
-            
         # 调用API
         try:
             logger.info(f"搜索小说关键词: {params}")
             
-            # 使用通用API调用方法
-            result = await self._call_api(bot, from_wxid, "小说", api_config_copy)
+            result = await self._search_upstream(bot, from_wxid, "novel", params, api_config.get("page_start", 1))
             
-            if result and isinstance(result, list):
+            if result:
                 # 记录返回结构以便调试
-                logger.info(f"小说搜索返回示例数据结构: {result[0] if result else None}")
-                
-                # 保存搜索结果到缓存
-                self._novel_cache = result
-                self._novel_search_keyword = params
-                
-                # 构建回复消息
-                reply = f"📚 搜索关键词：{params}\n"
-                reply += f"找到 {len(result)} 部相关小说：\n\n"
-                
-                # 每次最多显示15部小说
-                max_display = min(15, len(result))
-                
-                for i in range(max_display):
-                    novel = result[i]
-                    # 检查不同可能的标题字段名
-                    novel_title = self._extract_novel_field(novel, ["title", "name", "bookname", "book_name", "novel_name", "novel_title"])
-                    # 使用列表索引作为选择序号
-                    reply += f"{i+1}. {novel_title}\n"
-                    
-                    # 处理作者字段
-                    novel_author = self._extract_novel_field(novel, ["author", "writer", "auth", "aut", "creator", "作者"])
-                    if novel_author:
-                        reply += f"   作者：{novel_author}\n"
-                    
-                    # 处理类型字段
-                    novel_type = self._extract_novel_field(novel, ["type", "category", "class", "genre", "tag", "tags", "分类", "类型"])
-                    if novel_type:
-                        # 处理可能的数组或字符串
-                        if isinstance(novel_type, list):
-                            novel_type = "、".join(novel_type)
-                        reply += f"   类型：{novel_type}\n"
-                    reply += "\n"
-                
-                if len(result) > max_display:
-                    reply += f"... 共找到 {len(result)} 部相关小说\n"
-                
-                reply += "请回复数字序号查看小说详情"
-                
-                await bot.send_text_message(from_wxid, reply)
+                logger.info(f"小说搜索返回示例数据结构: {result[0]}")
+                await self._open_search_session(bot, message, "novel", params, result)
             else:
                 logger.warning(f"小说搜索返回数据异常: {result}")
                 
-                if not result:
-                    await bot.send_text_message(from_wxid, f"未找到与\"{params}\"相关的小说")
+                if result is not None:
+                    await self._send_text(bot, from_wxid, f"未找到与\"{params}\"相关的小说")
                 else:
-                    await bot.send_text_message(from_wxid, "搜索小说失败，返回数据格式错误")
+                    await self._send_text(bot, from_wxid, "搜索小说失败，返回数据格式错误")
         except Exception as e:
             logger.error(f"搜索小说失败: {str(e)}")
-            await bot.send_text_message(from_wxid, "搜索小说失败，请稍后重试")
-    
-    def _extract_novel_field(self, data: dict, possible_fields: list, default="未知"):
-        """从小说数据中提取指定字段，支持多种可能的字段名
-        
-        Args:
-            data: 小说数据字典
-            possible_fields: 可能的字段名列表
-            default: 默认值，当所有字段都不存在时返回
-            
-        Returns:
-            提取到的字段值或默认值
-        """
-        # 先尝试直接获取字段
-        for field in possible_fields:
-            value = data.get(field)
-            if value:
-                return value
-                
-        # 尝试检查是否有嵌套的info或data字段
-        for container in ["info", "data", "detail", "details"]:
-            if container in data and isinstance(data[container], dict):
-                for field in possible_fields:
-                    value = data[container].get(field)
-                    if value:
-                        return value
-        
-        # 尝试处理可能分开存储的特殊情况，例如first_name + last_name
-        if "first_name" in data and "last_name" in data:
-            if data["first_name"] and data["last_name"]:
-                return f"{data['first_name']} {data['last_name']}"
-                
-        # 尝试从原始返回数据中搜索包含特定关键词的字段
-        for key, value in data.items():
-            for field in possible_fields:
-                if field.lower() in key.lower() and value:
-                    return value
-        
-        return default
+            await self._send_text(bot, from_wxid, "搜索小说失败，请稍后重试")
     
     # 新增处理小说序号选择的方法
     async def _handle_novel_selection(self, bot: WechatAPIClient, message: dict, index: int):
         """处理小说序号选择"""
         from_wxid = message.get("FromWxid", "")
         
-        # 验证缓存和索引
-        if not hasattr(self, '_novel_cache') or not self._novel_cache:
-            await bot.send_text_message(from_wxid, "请先搜索小说，然后再选择序号")
+        # 验证搜索会话和索引
+        session = self._search_sessions.get(self._session_key(message, "novel"))
+        if not session:
+            await self._send_text(bot, from_wxid, "请先搜索小说，然后再选择序号")
             return
-            
-        if index <= 0 or index > len(self._novel_cache):
-            await bot.send_text_message(from_wxid, f"序号 {index} 无效，请输入1-{len(self._novel_cache)}之间的数字")
+        
+        novels = session["results"]
+        if index <= 0 or index > len(novels):
+            await self._send_text(bot, from_wxid, f"序号 {index} 无效，请输入1-{len(novels)}之间的数字")
             return
             
         # 获取选定的小说信息
-        novel = self._novel_cache[index-1]
-        novel_title = self._extract_novel_field(novel, ["title", "name", "bookname", "book_name", "novel_name", "novel_title"])
+        novel = novels[index-1]
+        novel_title = self._novel_fields.extract(novel)["title"]
         logger.info(f"用户选择了第{index}部小说: {novel_title}")
         
-        # 获取API配置
-        api_config = self.api_configs.get("小说")
-        if not api_config:
-            await bot.send_text_message(from_wxid, "小说搜索接口配置错误")
+        if not self.api_configs.get("小说"):
+            await self._send_text(bot, from_wxid, "小说搜索接口配置错误")
             return
+        
+        # 前几部的详情通常已在后台预取完成，其余序号现在获取
+        task = self._novel_detail_task(session, index)
+        await asyncio.wait([task])
+        detail = None if task.cancelled() else task.result()
+        if detail is None:
+            await self._send_text(bot, from_wxid, "获取小说详情失败，请稍后重试")
+            return
+        
+        fields, cover = detail
+        novel_title = fields["title"]
+        novel_author = fields["author"]
+        novel_type = fields["type"]
+        novel_download = fields["download"]
+        novel_summary = fields["summary"]
+        
+        # 处理类型字段，可能是数组
+        if isinstance(novel_type, list):
+            novel_type = "、".join(novel_type)
+        
+        # 构建详情回复
+        reply = f"📕 小说详情\n"
+        reply += f"━━━━━━━━━━━━━━━━\n"
+        reply += f"📗 书名: {novel_title}\n"
+        
+        if novel_author and novel_author != "未知":
+            reply += f"✍️ 作者: {novel_author}\n"
             
-        # 设置详情参数
-        api_config_copy = api_config.copy()
-        api_config_copy["params"] = {
-            "name": self._novel_search_keyword,
-            "n": str(index), 
-            "type": "json"
-        }
+        if novel_type and novel_type != "未知":
+            reply += f"📋 分类: {novel_type}\n"
+            
+        if cover is not None:
+            reply += f"🖼️ 封面: 见下方图片\n"
+            
+        if novel_download:
+            reply += f"📥 下载地址: {novel_download}\n"
         
-        try:
-            # 调用API获取详情
-            result = await self._call_api(bot, from_wxid, "小说", api_config_copy)
-            
-            # 记录返回结构以便调试
-            logger.info(f"小说详情返回数据结构: {result}")
-            
-            if result and isinstance(result, dict):
-                # 尝试从不同可能的字段获取信息
-                novel_title = self._extract_novel_field(result, ["title", "name", "bookname", "book_name", "novel_name", "novel_title"])
-                novel_author = self._extract_novel_field(result, ["author", "writer", "auth", "aut", "creator", "作者"])
-                novel_type = self._extract_novel_field(result, ["type", "category", "class", "genre", "tag", "tags", "分类", "类型"])
-                novel_img = self._extract_novel_field(result, ["img", "cover", "image", "pic", "picture", "thumb", "封面"], "")
-                novel_download = self._extract_novel_field(result, ["download", "link", "url", "download_url", "book_url", "下载链接"], "")
-                novel_summary = self._extract_novel_field(result, ["js", "summary", "desc", "description", "intro", "introduction", "content", "简介"], "")
-                
-                # 处理类型字段，可能是数组
-                if isinstance(novel_type, list):
-                    novel_type = "、".join(novel_type)
-                
-                # 构建详情回复
-                reply = f"📕 小说详情\n"
-                reply += f"━━━━━━━━━━━━━━━━\n"
-                reply += f"📗 书名: {novel_title}\n"
-                
-                if novel_author and novel_author != "未知":
-                    reply += f"✍️ 作者: {novel_author}\n"
-                    
-                if novel_type and novel_type != "未知":
-                    reply += f"📋 分类: {novel_type}\n"
-                    
-                if novel_img:
-                    reply += f"🖼️ 封面: 见下方图片\n"
-                    
-                if novel_download:
-                    reply += f"📥 下载地址: {novel_download}\n"
-                
-                if novel_summary and novel_summary != "未知":
-                    # 格式化概括内容，处理可能的HTML标签
-                    summary = novel_summary.replace("<br>", "\n").replace("&nbsp;", " ")
-                    reply += f"\n📝 内容简介:\n{summary}\n"
-                
-                await bot.send_text_message(from_wxid, reply)
-                
-                # 如果有封面图片，尝试发送
-                if novel_img and novel_img.startswith("http"):
-                    try:
-                        async with aiohttp.ClientSession() as session:
-                            async with session.get(novel_img) as response:
-                                if response.status == 200:
-                                    img_data = await response.read()
-                                    await bot.send_image_message(from_wxid, img_data)
-                    except Exception as img_e:
-                        logger.error(f"发送小说封面图片失败: {str(img_e)}")
-            else:
-                logger.warning(f"获取小说详情返回数据异常: {result}")
-                await bot.send_text_message(from_wxid, "获取小说详情失败，返回数据格式错误")
-        except Exception as e:
-            logger.error(f"获取小说详情失败: {str(e)}")
-            await bot.send_text_message(from_wxid, "获取小说详情失败，请稍后重试")
\ No newline at end of file
+        if novel_summary and novel_summary != "未知":
+            # 格式化概括内容，处理可能的HTML标签
+            summary = novel_summary.replace("<br>", "\n").replace("&nbsp;", " ")
+            reply += f"\n📝 内容简介:\n{summary}\n"
+        
+        await self._send_text(bot, from_wxid, reply)
+        
+        # 封面由会话持有，发送队列另持有一份引用
+        if cover is not None:
+            await self._send_media(bot, from_wxid, "img", cover)
\ No newline at end of file